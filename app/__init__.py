@@ -1,7 +1,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import os
+from werkzeug.utils import import_string
 import sqlite3
 
 # Initialize SQLAlchemy
@@ -11,11 +11,20 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
+# Blueprints registered when the BLUEPRINTS setting is not given
+DEFAULT_BLUEPRINTS = (
+    'app.routes.auth:auth_bp',
+    'app.routes.cases:cases_bp',
+    'app.routes.api:api_bp',
+    'app.routes.metrics:metrics_bp',
+)
+
 
 def get_db_connection():
     from flask import current_app
     conn = sqlite3.connect(
         current_app.config['DATABASE_PATH'],
+        timeout=current_app.config.get('SQLITE_BUSY_TIMEOUT', 5.0),
         detect_types=sqlite3.PARSE_DECLTYPES
     )
     conn.row_factory = sqlite3.Row
@@ -45,40 +54,53 @@ def create_app(config_class=None):
         def load_user(user_id):
             return User.query.get(int(user_id))
 
-        # Import and register blueprints
-        from app.routes.auth import auth_bp
-        from app.routes.cases import cases_bp
-        from app.routes.api import api_bp
-
-        app.register_blueprint(auth_bp)
-        app.register_blueprint(cases_bp)
-        app.register_blueprint(api_bp)
-
-        # Create tables for SQLAlchemy models
-        db.create_all()
-
-        # Initialize tables from schema.sql
-        db_path = app.config['DATABASE_PATH']
-        schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'schema.sql')
-
-        print(f"Database path: {db_path}")
-        print(f"Schema path: {schema_path}")
-
-        # Check if database file exists or is empty
-        db_exists = os.path.exists(db_path)
-        db_empty = db_exists and os.path.getsize(db_path) < 10000
-
-        if not db_exists or db_empty:
-            print("Creating database tables from schema.sql...")
-            try:
-                # Get absolute path to schema.sql
-                with sqlite3.connect(db_path) as conn:
-                    with open(schema_path, 'r') as f:
-                        conn.executescript(f.read())
-                print("Database tables created successfully")
-            except Exception as e:
-                print(f"Error initializing database: {e}")
-        else:
-            print("Database already exists and has content.")
-
-    return app
\ No newline at end of file
+        # Import and register only the configured blueprints, so e.g. a worker
+        # pool serving just the API does not load the interactive views
+        for blueprint in app.config.get('BLUEPRINTS', DEFAULT_BLUEPRINTS):
+            app.register_blueprint(import_string(blueprint))
+
+        bootstrap_database(app)
+
+    return app
+
+
+def bootstrap_database(app):
+    """
+    Make sure the database schema is up to date.
+
+    Normally this is a single PRAGMA read; tables are only created or
+    migrated when the stored schema version is behind (see app/utils/schema.py).
+    """
+    from app.utils.schema import schema_is_current, migrate_schema, SCHEMA_VERSION
+
+    db_path = app.config['DATABASE_PATH']
+    if schema_is_current(db_path):
+        _set_journal_mode(app)
+        return
+
+    # Tables for SQLAlchemy models are created in the same locked transaction
+    # as the migrations, so concurrently starting workers cannot race on them
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    model_ddl = []
+    for table in db.metadata.sorted_tables:
+        model_ddl.append(str(CreateTable(table, if_not_exists=True).compile(db.engine)))
+        for index in table.indexes:
+            model_ddl.append(str(CreateIndex(index, if_not_exists=True).compile(db.engine)))
+
+    applied = migrate_schema(db_path, model_ddl)
+    if applied:
+        app.logger.info('Database %s migrated to schema version %d (steps %s)',
+                        db_path, SCHEMA_VERSION, applied)
+    _set_journal_mode(app)
+
+
+def _set_journal_mode(app):
+    from app.utils.schema import ensure_journal_mode
+
+    mode = app.config.get('SQLITE_JOURNAL_MODE')
+    if not mode:
+        return
+    current = ensure_journal_mode(app.config['DATABASE_PATH'], mode,
+                                  app.config.get('SQLITE_BUSY_TIMEOUT', 5.0))
+    if current.lower() != mode.lower():
+        app.logger.warning('Could not set journal mode %s, database uses %s', mode, current)
@@ -1,3 +1,4 @@
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
@@ -12,7 +13,9 @@ class User(UserMixin, db.Model):
     hand_id = db.Column(db.String(20), nullable=True)  # Reference to HANDLAEGGARE table
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(
+            password, method=current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        )
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
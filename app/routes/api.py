@@ -1,27 +1,100 @@
-from flask import Blueprint, jsonify, current_app, g
-from flask_login import login_required
+from flask import Blueprint, jsonify, current_app, g, request, Response, stream_with_context
+from flask_login import login_required, current_user
 import sqlite3
 import datetime
+import threading
+from app.utils.jsonrows import encode_columnar, encode_object, encode_record, encode_records, Raw
+from app.utils import metrics, timeline, work_queue
+from app.utils.archive import ARCHIVED_SUMMARY_SQL, attach_archive, find_case_schema, is_archive_attached
+from app.utils.names import TableNameIndex
+from app.utils.export import EXPORT_FORMATS, parse_filters, stream_export
+from app.utils.ratelimit import check_rate_limit, create_limiter, limit_concurrency
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect('case_management.db')
+        g.db = sqlite3.connect(current_app.config['DATABASE_PATH'],
+                               timeout=current_app.config.get('SQLITE_BUSY_TIMEOUT', 5.0))
         g.db.row_factory = sqlite3.Row
+        metrics.DB_CONNECTIONS.inc(labels=('api',))
+        attach_archive(g.db, current_app.config.get('ARCHIVE_DATABASE_PATH'))
     return g.db
 
 
-def execute_query(query, args=(), one=False):
-    db = get_db()
-    cursor = db.execute(query, args)
+def query_rows(query, args=()):
+    """Execute a query and return (column names, row tuples) without building Row objects."""
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    with metrics.db_timer('api'):
+        cursor.execute(query, args)
+        rows = cursor.fetchall()
+    metrics.DB_ROWS.inc(len(rows), labels=('api',))
+    columns = [description[0] for description in cursor.description]
+    return columns, rows
 
-    if one:
-        result = cursor.fetchone()
-        return result and dict(result)  # Convert Row to dict if result exists
 
-    return [dict(row) for row in cursor.fetchall()]  # Convert all rows to dicts
+def json_response(fields, status=200):
+    """Build a JSON response from (key, value) pairs, see encode_object."""
+    return Response(encode_object(fields), status=status, mimetype='application/json')
+
+
+@api_bp.record_once
+def init_rate_limits(state):
+    # Only the API is limited; the interactive views in the cases blueprint
+    # are never rejected and keep the worker threads the API cannot take.
+    # The API calls those pages make have a larger bucket of their own.
+    state.app.extensions['api_rate_limiter'] = create_limiter(state.app.config)
+    state.app.extensions['api_ui_rate_limiter'] = create_limiter(state.app.config, 'API_UI')
+    max_concurrent = state.app.config.get('API_MAX_CONCURRENT', 0)
+    state.app.extensions['api_concurrency_gate'] = (
+        threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+    )
+
+
+@api_bp.record_once
+def init_name_index(state):
+    state.app.extensions['handler_names'] = TableNameIndex('HANDLAEGGARE', 'HAND_ID', 'HAND_NAMN')
+
+
+# Endpoints the web pages call as the clerk types or clicks (see main.js)
+INTERACTIVE_ENDPOINTS = {'api.search_handlers', 'api.get_timeline'}
+
+
+def is_page_request():
+    """
+    Whether this is a same-origin XHR from a logged-in web page. main.js sends
+    X-Requested-With; browsers send Sec-Fetch-Site, which scripts on other
+    sites cannot set to same-origin.
+    """
+    return (current_user.is_authenticated
+            and request.endpoint in INTERACTIVE_ENDPOINTS
+            and request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            and request.headers.get('Sec-Fetch-Site', 'same-origin') == 'same-origin')
+
+
+@api_bp.before_request
+def rate_limit():
+    # Calls from the web pages take from the user's separate, larger UI
+    # bucket, so heavy API use does not slow the clerk down and vice versa
+    if is_page_request():
+        limiter = current_app.extensions.get('api_ui_rate_limiter')
+        if limiter is None:
+            return None
+        return check_rate_limit(limiter, [f'ui:{current_user.get_id()}'])
+
+    limiter = current_app.extensions.get('api_rate_limiter')
+    if limiter is None:
+        return None
+    # Logged-in callers have their own bucket; the address bucket is only for
+    # anonymous requests, since many clerks may share one address behind NAT
+    # or a proxy
+    if current_user.is_authenticated:
+        key = f'user:{current_user.get_id()}'
+    else:
+        key = f'ip:{request.remote_addr}'
+    return check_rate_limit(limiter, [key])
 
 
 @api_bp.teardown_request
@@ -33,69 +106,217 @@ def close_db(exception):
 
 @api_bp.route('/cases', methods=['GET'])
 @login_required
+@limit_concurrency
 def get_cases():
-    """API endpoint to get all cases in JSON format"""
-    cases = execute_query('''
-        SELECT a.DNR, a.REG_ID, a.IN_UT, a.DOSS_NR, a.HAND_ID, a.ENHT_KOD,
-               a.REGDAT, a.STAT, a.ATEXT, r.REG_NAMN, h.HAND_NAMN,
-               d.NAMN as DOSS_NAMN, e.ENHT_NAMN
-        FROM AERENDE a
-        LEFT JOIN REG r ON a.REG_ID = r.REG_ID
-        LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
-        LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
-        LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
-        ORDER BY a.REGDAT DESC
-    ''')
+    """
+    API endpoint to get all cases in JSON format.
+
+    Pass ?format=columnar to get a column list plus one array per case
+    instead of one object per case, and ?include_archived=1 to include
+    cases moved to the archive database.
+    """
+    select = '''
+        SELECT DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD,
+               REGDAT, STAT, ATEXT, REG_NAMN, HAND_NAMN,
+               DOSS_NAMN, ENHT_NAMN
+        FROM {table}
+    '''
+    if request.args.get('include_archived') == '1' and is_archive_attached(get_db()):
+        query = (select.format(table='main.AERENDE_LISTA') + 'UNION ALL'
+                 + select.format(table=f'({ARCHIVED_SUMMARY_SQL})'))
+    else:
+        query = select.format(table='main.AERENDE_LISTA')
+    columns, cases = query_rows(query + 'ORDER BY REGDAT DESC')
+
+    if request.args.get('format') == 'columnar':
+        body = encode_columnar(columns, cases)
+    else:
+        body = encode_records(columns, cases)
+
+    return json_response([
+        ('status', 'success'),
+        ('count', len(cases)),
+        ('cases', Raw(body))
+    ])
+
+
+@api_bp.route('/queue', methods=['GET'])
+@login_required
+def get_queue():
+    """API endpoint for the current user's work queue in JSON format"""
+    hand_id = current_user.hand_id
+    if not hand_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'User is not linked to a handler'
+        }), 404
+
+    count_columns, counts = query_rows(work_queue.STATUS_COUNTS_SQL, [hand_id])
+    case_columns, cases = query_rows(
+        work_queue.OPEN_CASES_SQL,
+        [hand_id, current_app.config.get('WORK_QUEUE_LIMIT', 200)]
+    )
+    recent_columns, recent = query_rows(work_queue.RECENT_CASES_SQL, [hand_id, work_queue.RECENT_LIMIT])
+
+    return json_response([
+        ('status', 'success'),
+        ('hand_id', hand_id),
+        ('open_count', sum(count for _, count in counts)),
+        ('counts', Raw(encode_records(count_columns, counts))),
+        ('cases', Raw(encode_records(case_columns, cases))),
+        ('recent', Raw(encode_records(recent_columns, recent)))
+    ])
+
+
+@api_bp.route('/handlers', methods=['GET'])
+@login_required
+def search_handlers():
+    """
+    API endpoint for handler typeahead: handlers whose names best match ?q=.
+
+    The last word of q may be incomplete. Results are ordered by score and
+    then name; at most ?limit= (default 10, max 50) are returned.
+    """
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int) or 10, 50)
 
-    return jsonify({
-        'status': 'success',
-        'count': len(cases),
-        'cases': cases
-    })
+    index = current_app.extensions['handler_names'].get(get_db())
+    matches = index.search(query, limit=limit, min_score=0.3, prefix=True)
+
+    return json_response([
+        ('status', 'success'),
+        ('count', len(matches)),
+        ('handlers', Raw(encode_records(['HAND_ID', 'HAND_NAMN', 'SCORE'], matches)))
+    ])
 
 
 @api_bp.route('/case/<int:dnr>', methods=['GET'])
 @login_required
 def get_case(dnr):
     """API endpoint to get a single case by DNR in JSON format"""
+    # Closed cases may have been moved to the archive database
+    schema = find_case_schema(get_db(), dnr) or 'main'
+
     # Get case details
-    case = execute_query('''
+    case_columns, case_rows = query_rows(f'''
         SELECT a.*, r.REG_NAMN, h.HAND_NAMN, d.NAMN as DOSS_NAMN, e.ENHT_NAMN
-        FROM AERENDE a
+        FROM {schema}.AERENDE a
         LEFT JOIN REG r ON a.REG_ID = r.REG_ID
         LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
         LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
         LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
         WHERE a.DNR = ?
-    ''', [dnr], one=True)
+    ''', [dnr])
 
-    if not case:
+    if not case_rows:
         return jsonify({
             'status': 'error',
             'message': f'Case with DNR {dnr} not found'
         }), 404
 
     # Get case notes
-    notes = execute_query('''
+    note_columns, notes = query_rows(f'''
         SELECT n.*, h.HAND_NAMN
-        FROM AERENDE_ANT n
+        FROM {schema}.AERENDE_ANT n
         LEFT JOIN HANDLAEGGARE h ON n.HAND_ID = h.HAND_ID
         WHERE n.DNR = ?
         ORDER BY n.DATUMIN DESC, n.LNR DESC
     ''', [dnr])
 
     # Get log entries
-    logs = execute_query('''
+    log_columns, logs = query_rows(f'''
         SELECT l.*, r.REG_NAMN
-        FROM LOG l
+        FROM {schema}.LOG l
         LEFT JOIN REG r ON l.REG_ID = r.REG_ID
         WHERE l.DNR = ?
         ORDER BY l.LOGDAT DESC
     ''', [dnr])
 
-    return jsonify({
-        'status': 'success',
-        'case': case,
-        'notes': notes,
-        'logs': logs
-    })
\ No newline at end of file
+    return json_response([
+        ('status', 'success'),
+        ('archived', schema != 'main'),
+        ('case', Raw(encode_record(case_columns, case_rows[0]))),
+        ('notes', Raw(encode_records(note_columns, notes))),
+        ('logs', Raw(encode_records(log_columns, logs)))
+    ])
+
+
+@api_bp.route('/case/<int:dnr>/timeline', methods=['GET'])
+@login_required
+def get_timeline(dnr):
+    """
+    API endpoint for a case's notes and log entries as one stream, newest first.
+
+    Returns at most ?limit= events (default TIMELINE_PAGE_SIZE, max 200) and
+    a "next" cursor; pass it as ?before= to get the following page. Use
+    ?kind=note or ?kind=log for only one kind of event.
+    """
+    try:
+        kinds = timeline.parse_kinds(request.args.get('kind'))
+        before = request.args.get('before')
+        before = timeline.decode_cursor(before) if before else None
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    limit = request.args.get('limit', 0, type=int) or current_app.config.get('TIMELINE_PAGE_SIZE', 50)
+    limit = max(1, min(limit, 200))
+
+    # Closed cases may have been moved to the archive database
+    schema = find_case_schema(get_db(), dnr)
+    if schema is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Case with DNR {dnr} not found'
+        }), 404
+
+    columns, rows = query_rows(*timeline.timeline_query(dnr, schema, kinds, before, limit))
+    rows, next_cursor = timeline.page(rows, limit)
+
+    return json_response([
+        ('status', 'success'),
+        ('archived', schema != 'main'),
+        ('count', len(rows)),
+        ('events', Raw(encode_records(columns, rows))),
+        ('next', next_cursor)
+    ])
+
+
+@api_bp.route('/export', methods=['GET'])
+@login_required
+@limit_concurrency
+def export_cases():
+    """
+    API endpoint streaming a ZIP archive with one document per case.
+
+    Filters: doss_nr, enht_kod, from and to (registration date, YYYY-MM-DD).
+    Pass format=json for JSON documents instead of importable XML, and
+    include_archived=1 to include cases in the archive database.
+    """
+    fmt = request.args.get('format', 'xml')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown format {fmt!r}, expected one of {", ".join(EXPORT_FORMATS)}'
+        }), 400
+
+    try:
+        filters = parse_filters(
+            doss_nr=request.args.get('doss_nr'),
+            enht_kod=request.args.get('enht_kod'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to')
+        )
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid filter: {e}'
+        }), 400
+
+    chunks = stream_export(get_db(), filters, fmt, request.args.get('include_archived') == '1')
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=arenden_{datetime.date.today():%Y%m%d}.zip'}
+    )
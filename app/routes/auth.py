@@ -1,11 +1,29 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.exc import SQLAlchemyError
 from app.models.user import User
+from app.utils import metrics
+from app.utils.passwords import HasherBusy, PasswordHasher
 from app import db
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
+@auth_bp.record_once
+def init_password_hasher(state):
+    state.app.extensions['password_hasher'] = PasswordHasher.from_config(state.app.config)
+
+
+def rehash_password(user, password, hasher):
+    """Store a new hash made with the configured method; on failure the old one is kept."""
+    try:
+        user.password_hash = hasher.hash(password)
+        db.session.commit()
+    except (HasherBusy, SQLAlchemyError) as e:
+        db.session.rollback()
+        current_app.logger.warning('Could not rehash password of %s: %s', user.username, e)
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -17,11 +35,24 @@ def login():
         remember = True if request.form.get('remember') else False
 
         user = User.query.filter_by(username=username).first()
+        hasher = current_app.extensions['password_hasher']
+
+        try:
+            valid = user is not None and hasher.verify(user.password_hash, password)
+        except HasherBusy:
+            metrics.LOGINS.inc(labels=('busy',))
+            flash('Många inloggningar pågår just nu. Försök igen om en stund.', 'warning')
+            return render_template('auth/login.html'), 503
 
-        if not user or not user.check_password(password):
+        if not valid:
+            metrics.LOGINS.inc(labels=('failed',))
             flash('Kontrollera dina inloggningsuppgifter och försök igen.', 'danger')
             return redirect(url_for('auth.login'))
 
+        metrics.LOGINS.inc(labels=('ok',))
+        if hasher.needs_rehash(user.password_hash):
+            rehash_password(user, password, hasher)
+
         login_user(user, remember=remember)
         next_page = request.args.get('next')
         return redirect(next_page or url_for('cases.index'))
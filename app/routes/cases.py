@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, g
+from flask import (Blueprint, render_template, stream_template, redirect, url_for, request, flash, current_app, g,
+                   get_flashed_messages)
 from flask_login import login_required, current_user
+from markupsafe import Markup
 import sqlite3
 import datetime
+from app.utils.fragment_cache import FragmentCache
+from app.utils import metrics, timeline, work_queue
+from app.utils.archive import ARCHIVED_SUMMARY_SQL, attach_archive, find_case_schema, is_archive_attached
+from app.utils.db import is_busy_error, write_transaction
 
 cases_bp = Blueprint('cases', __name__)
 
@@ -9,23 +15,110 @@ cases_bp = Blueprint('cases', __name__)
 def get_db():
     if 'db' not in g:
         db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        g.db = sqlite3.connect(db_path)
+        g.db = sqlite3.connect(db_path, timeout=current_app.config.get('SQLITE_BUSY_TIMEOUT', 5.0))
         g.db.row_factory = sqlite3.Row
+        metrics.DB_CONNECTIONS.inc(labels=('cases',))
+        attach_archive(g.db, current_app.config.get('ARCHIVE_DATABASE_PATH'))
     return g.db
 
 
+def flash_error(error):
+    """Flash a database error; lock timeouts get a message the user can act on."""
+    if is_busy_error(error):
+        flash('Databasen är upptagen just nu. Försök igen om en stund.', 'warning')
+    else:
+        flash(f'Ett fel inträffade: {str(error)}', 'danger')
+
+
+def handler_search_url():
+    """URL of the handler typeahead, or None if the API is not registered in this process."""
+    if 'api.search_handlers' in current_app.view_functions:
+        return url_for('api.search_handlers')
+    return None
+
+
+def timeline_url(dnr):
+    """URL of the case timeline API, or None if the API is not registered in this process."""
+    if 'api.get_timeline' in current_app.view_functions:
+        return url_for('api.get_timeline', dnr=dnr)
+    return None
+
+
+def next_log_time(db, dnr, reg_id):
+    """
+    Timestamp for a new LOG entry, to be called inside the write transaction.
+
+    LOG is keyed on (DNR, REG_ID, LOGDAT) with one-second resolution, so if
+    the case already has an entry at or after this second the new one is
+    placed one second after it.
+    """
+    now = datetime.datetime.now().replace(microsecond=0)
+    latest = db.execute(
+        'SELECT MAX(LOGDAT) FROM LOG WHERE DNR = ? AND REG_ID = ?', [dnr, reg_id]
+    ).fetchone()[0]
+    if latest:
+        try:
+            latest = datetime.datetime.fromisoformat(str(latest))
+        except ValueError:
+            latest = None
+        if latest is not None and latest >= now:
+            now = latest + datetime.timedelta(seconds=1)
+    return now.strftime("%Y-%m-%d %H:%M:%S")
+
+
 def execute_query(query, args=(), one=False, commit=False):
     db = get_db()
-    cursor = db.execute(query, args)
+    with metrics.db_timer('cases'):
+        cursor = db.execute(query, args)
+
+        if commit:
+            db.commit()
+            return cursor.lastrowid
 
-    if commit:
-        db.commit()
-        return cursor.lastrowid
+        if one:
+            row = cursor.fetchone()
+            metrics.DB_ROWS.inc(0 if row is None else 1, labels=('cases',))
+            return row
 
-    if one:
-        return cursor.fetchone()
+        rows = cursor.fetchall()
+    metrics.DB_ROWS.inc(len(rows), labels=('cases',))
+    return rows
 
-    return cursor.fetchall()
+
+def iter_query(query, args=()):
+    """Execute a query and yield the rows lazily from the cursor."""
+    with metrics.db_timer('cases'):
+        cursor = get_db().execute(query, args)
+    count = 0
+    try:
+        for row in cursor:
+            count += 1
+            yield row
+    finally:
+        metrics.DB_ROWS.inc(count, labels=('cases',))
+
+
+@cases_bp.record_once
+def init_row_cache(state):
+    state.app.extensions['case_row_cache'] = FragmentCache(
+        state.app.config.get('CASE_ROW_CACHE_SIZE', 10000)
+    )
+
+
+@cases_bp.app_template_global()
+def case_row(case):
+    """
+    Render one row of the case list, cached per case revision (AERENDE_LISTA.REV).
+
+    The names are part of the key as well: archived rows keep their REV when
+    a registrator or handler is renamed (see ARCHIVED_SUMMARY_SQL).
+    """
+    cache = current_app.extensions['case_row_cache']
+    template = current_app.jinja_env.get_template('cases/_case_row.html')
+    return Markup(cache.get_or_render(
+        (case['DNR'], case['REV'], case['REG_NAMN'], case['HAND_NAMN']),
+        lambda: template.render(case=case)
+    ))
 
 
 @cases_bp.teardown_request
@@ -35,30 +128,68 @@ def close_db(exception):
         db.close()
 
 
+# Summary columns used by the case list rows (cases/_case_row.html)
+LIST_COLUMNS = 'DNR, REG_ID, IN_UT, STAT, ATEXT, REGDAT, REG_NAMN, HAND_ID, HAND_NAMN, REV'
+
+
 @cases_bp.route('/')
 @login_required
 def index():
-    # Get all cases with raw SQL
-    cases = execute_query('''
-        SELECT a.*, r.REG_NAMN, h.HAND_NAMN, d.NAMN as DOSS_NAMN, e.ENHT_NAMN
-        FROM AERENDE a
-        LEFT JOIN REG r ON a.REG_ID = r.REG_ID
-        LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
-        LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
-        LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
-        ORDER BY a.REGDAT DESC
-    ''')
+    # Get all cases from the denormalized summary table (see case_summary.sql).
+    # The rows are read lazily while the page is streamed to the client.
+    include_archived = request.args.get('include_archived') == '1' and is_archive_attached(get_db())
+    if include_archived:
+        cases = iter_query(f'''
+            SELECT {LIST_COLUMNS} FROM main.AERENDE_LISTA
+            UNION ALL
+            SELECT {LIST_COLUMNS} FROM ({ARCHIVED_SUMMARY_SQL})
+            ORDER BY REGDAT DESC
+        ''')
+    else:
+        cases = iter_query(f'''
+            SELECT {LIST_COLUMNS} FROM AERENDE_LISTA
+            ORDER BY REGDAT DESC
+        ''')
+
+    # The session is saved before the body is streamed, so the flashed
+    # messages must be taken out of it now; get_flashed_messages() keeps them
+    # on the request context for the layout to show
+    get_flashed_messages()
+    return stream_template('cases/index.html', cases=cases, include_archived=include_archived)
+
+
+@cases_bp.route('/queue')
+@login_required
+def my_queue():
+    """The current user's work queue: open cases for their handler, with counts and recent activity."""
+    if not current_user.hand_id:
+        flash('Ditt konto är inte kopplat till någon handläggare.', 'info')
+        return render_template('cases/queue.html', handler=None, counts=[], cases=[], recent=[])
+
+    handler = execute_query('SELECT * FROM HANDLAEGGARE WHERE HAND_ID = ?', [current_user.hand_id], one=True)
+    counts = execute_query(work_queue.STATUS_COUNTS_SQL, [current_user.hand_id])
+    cases = execute_query(
+        work_queue.OPEN_CASES_SQL,
+        [current_user.hand_id, current_app.config.get('WORK_QUEUE_LIMIT', 200)]
+    )
+    recent = execute_query(work_queue.RECENT_CASES_SQL, [current_user.hand_id, work_queue.RECENT_LIMIT])
 
-    return render_template('cases/index.html', cases=cases)
+    return render_template('cases/queue.html', handler=handler, counts=counts, cases=cases, recent=recent)
 
 
 @cases_bp.route('/case/<int:dnr>')
 @login_required
 def view_case(dnr):
+    # Closed cases may have been moved to the archive database
+    schema = find_case_schema(get_db(), dnr)
+    if schema is None:
+        flash('Ärendet hittades inte.', 'danger')
+        return redirect(url_for('cases.index'))
+
     # Get case details
-    case = execute_query('''
+    case = execute_query(f'''
         SELECT a.*, r.REG_NAMN, h.HAND_NAMN, d.NAMN as DOSS_NAMN, e.ENHT_NAMN
-        FROM AERENDE a
+        FROM {schema}.AERENDE a
         LEFT JOIN REG r ON a.REG_ID = r.REG_ID
         LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
         LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
@@ -70,25 +201,19 @@ def view_case(dnr):
         flash('Ärendet hittades inte.', 'danger')
         return redirect(url_for('cases.index'))
 
-    # Get case notes
-    notes = execute_query('''
-        SELECT n.*, h.HAND_NAMN
-        FROM AERENDE_ANT n
-        LEFT JOIN HANDLAEGGARE h ON n.HAND_ID = h.HAND_ID
-        WHERE n.DNR = ?
-        ORDER BY n.DATUMIN DESC, n.LNR DESC
-    ''', [dnr])
-
-    # Get log entries
-    logs = execute_query('''
-        SELECT l.*, r.REG_NAMN
-        FROM LOG l
-        LEFT JOIN REG r ON l.REG_ID = r.REG_ID
-        WHERE l.DNR = ?
-        ORDER BY l.LOGDAT DESC
-    ''', [dnr])
+    # Only the newest page of notes and of log entries; older ones are
+    # loaded from the timeline API when asked for
+    page_size = current_app.config.get('TIMELINE_PAGE_SIZE', 50)
+    notes, notes_cursor = timeline.page(
+        execute_query(*timeline.timeline_query(dnr, schema, ('note',), limit=page_size)), page_size
+    )
+    logs, logs_cursor = timeline.page(
+        execute_query(*timeline.timeline_query(dnr, schema, ('log',), limit=page_size)), page_size
+    )
 
-    return render_template('cases/view.html', case=case, notes=notes, logs=logs)
+    return render_template('cases/view.html', case=case, notes=notes, logs=logs,
+                           notes_cursor=notes_cursor, logs_cursor=logs_cursor,
+                           timeline_url=timeline_url(dnr), archived=schema != 'main')
 
 
 @cases_bp.route('/case/new', methods=['GET', 'POST'])
@@ -115,9 +240,9 @@ def new_case():
         motpart_bet = request.form.get('motpart_bet')
         fran_till = request.form.get('fran_till')
 
-        try:
-            # Insert new case
-            dnr = execute_query('''
+        def create_case(db):
+            # Insert the case and its log entry in one transaction
+            dnr = db.execute('''
                 INSERT INTO AERENDE (
                     REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD, 
                     INKUPP, REGDAT, AVSDAT, STAT, ATEXT, 
@@ -127,22 +252,26 @@ def new_case():
                 reg_id, in_ut, doss_nr, hand_id, enht_kod,
                 inkupp, regdat, avsdat, stat, atext,
                 motpart_bet, fran_till
-            ], commit=True)
+            ]).lastrowid
 
             # Add log entry
-            execute_query('''
+            db.execute('''
                 INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
                 VALUES (?, ?, ?, ?)
             ''', [
                 dnr, reg_id, datetime.date.today().isoformat(),
                 f'Nytt ärende skapat av {current_user.username}'
-            ], commit=True)
+            ])
+            return dnr
+
+        try:
+            dnr = write_transaction(get_db(), create_case)
 
             flash('Ärendet har skapats.', 'success')
             return redirect(url_for('cases.view_case', dnr=dnr))
 
         except Exception as e:
-            flash(f'Ett fel inträffade: {str(e)}', 'danger')
+            flash_error(e)
 
     return render_template(
         'cases/create.html',
@@ -150,7 +279,8 @@ def new_case():
         dossiers=dossiers,
         handlers=handlers,
         units=units,
-        today=datetime.date.today().isoformat()
+        today=datetime.date.today().isoformat(),
+        handler_search_url=handler_search_url()
     )
 
 
@@ -185,9 +315,9 @@ def edit_case(dnr):
         motpart_bet = request.form.get('motpart_bet')
         fran_till = request.form.get('fran_till')
 
-        try:
-            # Update the case
-            execute_query('''
+        def update_case(db):
+            # Update the case and log the change in one transaction
+            db.execute('''
                 UPDATE AERENDE SET
                     REG_ID = ?, IN_UT = ?, DOSS_NR = ?, HAND_ID = ?, ENHT_KOD = ?,
                     INKUPP = ?, REGDAT = ?, AVSDAT = ?, STAT = ?, ATEXT = ?,
@@ -197,22 +327,25 @@ def edit_case(dnr):
                 reg_id, in_ut, doss_nr, hand_id, enht_kod,
                 inkupp, regdat, avsdat, stat, atext,
                 motpart_bet, fran_till, dnr
-            ], commit=True)
+            ])
 
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            execute_query('''
+            current_time = next_log_time(db, dnr, reg_id)
+            db.execute('''
                 INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
                 VALUES (?, ?, ?, ?)
             ''', [
                 dnr, reg_id, current_time,
                 f'Ärende uppdaterat av {current_user.username}'
-            ], commit=True)
+            ])
+
+        try:
+            write_transaction(get_db(), update_case)
 
             flash('Ärendet har uppdaterats.', 'success')
             return redirect(url_for('cases.view_case', dnr=dnr))
 
         except Exception as e:
-            flash(f'Ett fel inträffade: {str(e)}', 'danger')
+            flash_error(e)
 
     return render_template(
         'cases/edit.html',
@@ -220,7 +353,8 @@ def edit_case(dnr):
         registries=registries,
         dossiers=dossiers,
         handlers=handlers,
-        units=units
+        units=units,
+        handler_search_url=handler_search_url()
     )
 
 
@@ -242,17 +376,17 @@ def add_note(dnr):
     hand_id = request.form.get('hand_id') or None
     avsmot = request.form.get('avsmot') or None
 
-    try:
-        # Get next LNR (line number) for this case
-        last_note = execute_query(
+    def insert_note(db):
+        # Get next LNR (line number) for this case; read inside the write
+        # transaction so two clerks cannot get the same number
+        last_note = db.execute(
             'SELECT MAX(LNR) as max_lnr FROM AERENDE_ANT WHERE DNR = ?',
-            [dnr],
-            one=True
-        )
+            [dnr]
+        ).fetchone()
         lnr = 1 if not last_note or last_note['max_lnr'] is None else last_note['max_lnr'] + 1
 
         # Insert note
-        execute_query('''
+        db.execute('''
             INSERT INTO AERENDE_ANT (
                 DNR, LNR, IN_UT, ANT_TEXT, REG_ID,
                 DATUMIN, HAND_ID, AVSMOT
@@ -260,19 +394,22 @@ def add_note(dnr):
         ''', [
             dnr, lnr, in_ut, ant_text, reg_id,
             datumin, hand_id, avsmot
-        ], commit=True)
+        ])
 
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        execute_query('''
+        current_time = next_log_time(db, dnr, reg_id)
+        db.execute('''
             INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
             VALUES (?, ?, ?, ?)
         ''', [
             dnr, reg_id, current_time,
             f'Ny anteckning tillagd av {current_user.username}'
-        ], commit=True)
+        ])
+
+    try:
+        write_transaction(get_db(), insert_note)
 
         flash('Anteckning har lagts till.', 'success')
     except Exception as e:
-        flash(f'Ett fel inträffade: {str(e)}', 'danger')
+        flash_error(e)
 
     return redirect(url_for('cases.view_case', dnr=dnr))
\ No newline at end of file
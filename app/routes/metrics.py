@@ -0,0 +1,46 @@
+from flask import Blueprint, Response, abort, current_app, g, request
+from flask_login import current_user
+import time
+from app.utils import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    # Unmatched URLs share one label so scans cannot create unbounded series
+    endpoint = request.endpoint or 'unmatched'
+    metrics.REQUESTS.inc(labels=(endpoint, request.method, str(response.status_code)))
+
+    def observe():
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, labels=(endpoint,))
+
+    # Streamed responses are timed until the last chunk has been sent
+    if response.is_streamed:
+        response.call_on_close(observe)
+    else:
+        observe()
+    return response
+
+
+@metrics_bp.route('/metrics')
+def export_metrics():
+    """
+    Metrics for all endpoints in the Prometheus text exposition format.
+
+    Only for logged-in users and for scrapers connecting from one of the
+    METRICS_ALLOWED_ADDRESSES (by default the local machine).
+    """
+    allowed = current_app.config.get('METRICS_ALLOWED_ADDRESSES', ('127.0.0.1', '::1'))
+    if request.remote_addr not in allowed and not current_user.is_authenticated:
+        abort(403)
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
@@ -66,6 +66,115 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Handler typeahead: narrow the handler select to the best matches
+    function normalizeName(name) {
+        // The same normalization as normalize_name() in app/utils/names.py
+        return name.normalize('NFKC').toLowerCase().split(/\s+/).filter(Boolean).join(' ');
+    }
+
+    const handlerSearches = document.querySelectorAll('.handler-search');
+    handlerSearches.forEach(function(input) {
+        const select = document.getElementById(input.dataset.target);
+        if (!select) {
+            return;
+        }
+        const allOptions = Array.from(select.options).map(function(option) {
+            return option.cloneNode(true);
+        });
+        let timer = null;
+        let latest = 0;
+
+        function showOptions(options) {
+            const selected = select.value;
+            select.innerHTML = '';
+            select.appendChild(allOptions[0].cloneNode(true));
+            options.forEach(function(option) {
+                select.appendChild(option);
+            });
+            if (Array.from(select.options).some(function(option) { return option.value === selected; })) {
+                select.value = selected;
+            }
+        }
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = this.value.trim();
+            if (!query) {
+                showOptions(allOptions.slice(1).map(function(option) { return option.cloneNode(true); }));
+                return;
+            }
+            timer = setTimeout(function() {
+                const request = ++latest;
+                fetch(input.dataset.url + '?q=' + encodeURIComponent(query),
+                      {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        // Ignore answers to queries that have since been replaced
+                        if (request !== latest || data.status !== 'success') {
+                            return;
+                        }
+                        showOptions(data.handlers.map(function(handler) {
+                            return new Option(handler.HAND_NAMN, handler.HAND_ID);
+                        }));
+                        // Only an exact name is selected for the clerk; a similar
+                        // one ("Ann" -> "Johanna") must be chosen from the list
+                        const exact = data.handlers.find(function(handler) {
+                            return normalizeName(handler.HAND_NAMN) === normalizeName(query);
+                        });
+                        if (exact && !select.value) {
+                            select.value = exact.HAND_ID;
+                        }
+                    });
+            }, 200);
+        });
+    });
+
+    // Case page: load older notes or log entries one page at a time
+    const moreButtons = document.querySelectorAll('.timeline-more');
+    moreButtons.forEach(function(button) {
+        const list = document.getElementById(button.dataset.list);
+        const template = document.getElementById(button.dataset.template);
+
+        function renderEvent(event) {
+            const item = template.content.firstElementChild.cloneNode(true);
+            item.querySelectorAll('[data-optional]').forEach(function(element) {
+                if (!event[element.dataset.optional]) {
+                    element.remove();
+                }
+            });
+            item.querySelectorAll('[data-field]').forEach(function(element) {
+                const value = event[element.dataset.field];
+                element.textContent = value === null || value === undefined ? '' : value;
+            });
+            return item;
+        }
+
+        button.addEventListener('click', function() {
+            const params = new URLSearchParams({kind: button.dataset.kind, before: button.dataset.cursor});
+            button.disabled = true;
+            fetch(button.dataset.url + '?' + params, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    if (data.status !== 'success') {
+                        button.disabled = false;
+                        return;
+                    }
+                    data.events.forEach(function(event) {
+                        list.appendChild(renderEvent(event));
+                    });
+                    if (data.next) {
+                        button.dataset.cursor = data.next;
+                        button.disabled = false;
+                    } else {
+                        button.remove();
+                    }
+                })
+                .catch(function() {
+                    button.disabled = false;
+                });
+        });
+    });
+
     // Confirm delete or close actions
     const confirmButtons = document.querySelectorAll('.confirm-action');
     confirmButtons.forEach(function(button) {
@@ -0,0 +1,140 @@
+"""
+Archive partitioning for closed cases.
+
+Closed cases (STAT = 'Avslutad' with an AVSDAT before a cutoff) are moved,
+together with their notes, logs and summary row, from the main database to
+a separate SQLite file. Request connections attach that file as the schema
+``arkiv`` so archived cases can still be read; tables with the same names
+resolve to the main database unless qualified with ``arkiv.``.
+"""
+
+import os
+import sqlite3
+
+ARCHIVE_SCHEMA = 'arkiv'
+
+# Tables moved to the archive, in the order rows are copied
+ARCHIVED_TABLES = ('AERENDE', 'AERENDE_ANT', 'LOG', 'AERENDE_LISTA')
+
+# The archived summary rows with the current names of their registrator,
+# handler, dossier and unit. The summary triggers cannot reach the archive,
+# so the names stored in arkiv.AERENDE_LISTA are those at the time of
+# archiving; read archived summary rows through this query instead.
+ARCHIVED_SUMMARY_SQL = f'''
+    SELECT s.DNR, s.REG_ID, s.IN_UT, s.DOSS_NR, s.HAND_ID, s.ENHT_KOD, s.REGDAT, s.STAT, s.ATEXT,
+           r.REG_NAMN, h.HAND_NAMN, d.NAMN AS DOSS_NAMN, e.ENHT_NAMN, s.REV, s.SENAST
+    FROM {ARCHIVE_SCHEMA}.AERENDE_LISTA s
+    LEFT JOIN main.REG r ON s.REG_ID = r.REG_ID
+    LEFT JOIN main.HANDLAEGGARE h ON s.HAND_ID = h.HAND_ID
+    LEFT JOIN main.DOSSIEPLAN d ON s.DOSS_NR = d.DOSS_NR
+    LEFT JOIN main.ENHET e ON s.ENHT_KOD = e.ENHT_KOD
+'''
+
+
+def attach_archive(conn: sqlite3.Connection, archive_path: str) -> bool:
+    """Attach the archive database if it exists. Returns True if it is attached."""
+    if not archive_path or not os.path.exists(archive_path):
+        return False
+    if not is_archive_attached(conn):
+        conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (archive_path,))
+    return True
+
+
+def is_archive_attached(conn: sqlite3.Connection) -> bool:
+    return any(row[1] == ARCHIVE_SCHEMA for row in conn.execute('PRAGMA database_list'))
+
+
+def find_case_schema(conn: sqlite3.Connection, dnr: int):
+    """Return 'main' or 'arkiv' depending on where the case is stored, or None."""
+    if conn.execute('SELECT 1 FROM main.AERENDE WHERE DNR = ?', (dnr,)).fetchone():
+        return 'main'
+    if is_archive_attached(conn) and conn.execute(
+            f'SELECT 1 FROM {ARCHIVE_SCHEMA}.AERENDE WHERE DNR = ?', (dnr,)).fetchone():
+        return ARCHIVE_SCHEMA
+    return None
+
+
+def _columns(conn, schema, table):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def ensure_archive_schema(conn: sqlite3.Connection) -> None:
+    """
+    Create the archive tables and indexes from their definitions in the main database.
+
+    Columns added to a main table since the archive was created are added to
+    the archive table as well.
+    """
+    for table in ARCHIVED_TABLES:
+        (sql,) = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        conn.execute(sql.replace('CREATE TABLE ', f'CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.', 1))
+
+        archived = {name for name, _ in _columns(conn, ARCHIVE_SCHEMA, table)}
+        for name, column_type in _columns(conn, 'main', table):
+            if name not in archived:
+                conn.execute(f'ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {name} {column_type}')
+
+        indexes = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+        for (sql,) in indexes:
+            conn.execute(sql.replace('CREATE INDEX ', f'CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.', 1))
+
+
+def archive_closed_cases(db_path: str, archive_path: str, before: str, dry_run: bool = False) -> int:
+    """
+    Move cases closed before the given date (YYYY-MM-DD) to the archive database.
+
+    A transaction spanning attached databases is only atomic per file when
+    the main database is in WAL mode, so the move takes two steps: the cases
+    are copied to the archive and committed, and a second transaction then
+    deletes from the main database the cases that are in the archive. A
+    crash at any point leaves a case in both databases, never in neither,
+    and running again finishes the move. Returns the number of cases moved.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (archive_path,))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ensure_archive_schema(conn)
+            conn.execute('''
+                CREATE TEMP TABLE ARKIVERA AS
+                SELECT DNR FROM main.AERENDE
+                WHERE STAT = 'Avslutad' AND AVSDAT IS NOT NULL AND AVSDAT < ?
+            ''', (before,))
+            (count,) = conn.execute('SELECT COUNT(*) FROM temp.ARKIVERA').fetchone()
+
+            if not dry_run:
+                # Copy everything, including the summary rows, which the
+                # AERENDE delete trigger removes from the main database
+                for table in ARCHIVED_TABLES:
+                    columns = ', '.join(name for name, _ in _columns(conn, 'main', table))
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE DNR IN (SELECT DNR FROM temp.ARKIVERA)
+                    ''')
+
+            conn.execute('DROP TABLE temp.ARKIVERA')
+            conn.execute('ROLLBACK' if dry_run else 'COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if not dry_run:
+            # Only cases whose copy is committed are deleted; this also
+            # completes the deletes of an earlier run that was interrupted
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table in ('AERENDE_ANT', 'LOG', 'AERENDE'):
+                    conn.execute(f'DELETE FROM main.{table} WHERE DNR IN (SELECT DNR FROM {ARCHIVE_SCHEMA}.AERENDE)')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+    finally:
+        conn.close()
+    return count
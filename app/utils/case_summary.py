@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+from app.utils.schema import execute_sql_file
+
+SUMMARY_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'case_summary.sql')
+
+
+# Columns added to AERENDE_LISTA after it was first introduced
+ADDED_COLUMNS = [
+    ('REV', 'INTEGER NOT NULL DEFAULT 1'),
+    ('SENAST', 'DATE'),
+]
+
+
+def ensure_case_summary(conn: sqlite3.Connection, commit: bool = True) -> bool:
+    """
+    Create the AERENDE_LISTA table and its triggers if they are missing.
+
+    A newly created table is filled from AERENDE; an existing table that lacks
+    columns is upgraded. Returns True if the table had to be created. Pass
+    commit=False to run inside the caller's transaction.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(AERENDE_LISTA)')]
+    if columns and any(name not in columns for name, _ in ADDED_COLUMNS):
+        upgrade_case_summary(conn, commit=commit)
+        return False
+
+    execute_sql_file(conn, SUMMARY_SQL_PATH)
+
+    if not columns:
+        _refill(conn)
+    if commit:
+        conn.commit()
+    return not columns
+
+
+def upgrade_case_summary(conn: sqlite3.Connection, commit: bool = True) -> None:
+    """
+    Bring an existing AERENDE_LISTA up to date with case_summary.sql.
+
+    Missing columns are added and the triggers are recreated, since their
+    bodies may have changed. The table is then refilled, which also bumps
+    every REV so no stale cached rows are served.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(AERENDE_LISTA)')]
+    _drop_triggers(conn)
+    for name, definition in ADDED_COLUMNS:
+        if name not in columns:
+            conn.execute(f'ALTER TABLE AERENDE_LISTA ADD COLUMN {name} {definition}')
+    execute_sql_file(conn, SUMMARY_SQL_PATH)
+    _refill(conn)
+    if commit:
+        conn.commit()
+
+
+def rebuild_case_summary(conn: sqlite3.Connection) -> int:
+    """
+    Refill AERENDE_LISTA from AERENDE and the dimension tables.
+
+    Every row gets a new REV from the AERENDE_LISTA_REV counter so that
+    cached list rows are never reused for rebuilt data. Returns the number
+    of rows.
+    """
+    with conn:
+        return _refill(conn)
+
+
+def _drop_triggers(conn):
+    triggers = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'AERENDE\\_LISTA\\_%' ESCAPE '\\'"
+    ).fetchall()
+    for (name,) in triggers:
+        conn.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+
+
+def _refill(conn):
+    conn.execute('DELETE FROM AERENDE_LISTA WHERE DNR NOT IN (SELECT DNR FROM AERENDE)')
+    conn.execute('UPDATE AERENDE_LISTA_REV SET REV = REV + 1')
+    cursor = conn.execute('''
+        INSERT OR REPLACE INTO AERENDE_LISTA (
+            DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD, REGDAT, STAT, ATEXT,
+            REG_NAMN, HAND_NAMN, DOSS_NAMN, ENHT_NAMN, REV, SENAST
+        )
+        SELECT a.DNR, a.REG_ID, a.IN_UT, a.DOSS_NR, a.HAND_ID, a.ENHT_KOD, a.REGDAT, a.STAT, a.ATEXT,
+               r.REG_NAMN, h.HAND_NAMN, d.NAMN, e.ENHT_NAMN, (SELECT REV FROM AERENDE_LISTA_REV),
+               (SELECT MAX(LOGDAT) FROM LOG l WHERE l.DNR = a.DNR)
+        FROM AERENDE a
+        LEFT JOIN REG r ON a.REG_ID = r.REG_ID
+        LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
+        LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
+        LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
+    ''')
+    return cursor.rowcount
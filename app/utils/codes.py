@@ -0,0 +1,40 @@
+"""
+Codes of the case XML format, shared by the importer (import_xml.py) and
+the export (app/utils/export.py) so that an export can be imported again.
+"""
+
+# XML code -> database value
+DIRECTION_MAP = {
+    'I': 'IN',
+    'U': 'UT',
+    '': 'INTERN'
+}
+
+STATUS_MAP = {
+    'Ö': 'Pågående',
+    'A': 'Avslutad',
+    '': 'Ny'
+}
+
+# Database value -> XML code
+DIRECTION_CODES = {value: code for code, value in DIRECTION_MAP.items()}
+STATUS_CODES = {value: code for code, value in STATUS_MAP.items()}
+
+# A Logg names the changed field (Faeltnamn); LOG.LOGFLT stores it after this prefix
+LOG_FIELD_PREFIX = 'Ändring av '
+
+
+def log_text(field: str) -> str:
+    """LOG.LOGFLT for a Logg whose Faeltnamn is field."""
+    return f'{LOG_FIELD_PREFIX}{field}'
+
+
+def log_field(text):
+    """
+    The Faeltnamn that log_text() turns into text, or None if text was not
+    written that way (e.g. entries made by the web application), in which
+    case the export carries the whole text in Loggtext instead.
+    """
+    if text is not None and text.startswith(LOG_FIELD_PREFIX):
+        return text[len(LOG_FIELD_PREFIX):]
+    return None
@@ -1,7 +1,20 @@
+import random
 import sqlite3
+import threading
+import time
 from flask import current_app, g
 import os
 
+from app.utils import metrics
+
+# SQLite result codes (the primary code is the low byte of an extended code)
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+# Held around every write transaction when SQLITE_SERIALIZE_WRITES is set
+_write_lock = threading.Lock()
+
+
 def get_db():
     """Get a database connection. Store it in the g object if not already there."""
     if 'db' not in g:
@@ -13,6 +26,7 @@ def get_db():
 
         g.db = sqlite3.connect(
             db_path,
+            timeout=current_app.config.get('SQLITE_BUSY_TIMEOUT', 5.0),
             detect_types=sqlite3.PARSE_DECLTYPES
         )
         g.db.row_factory = sqlite3.Row
@@ -41,6 +55,63 @@ def execute_query(query, args=(), one=False, commit=False):
     return cursor.fetchall()
 
 
+def is_busy_error(error):
+    """True if the error means another connection holds a lock (SQLITE_BUSY or SQLITE_LOCKED)."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+def write_transaction(conn, work, retries=None, serialize=None):
+    """
+    Run work(conn) in a single write transaction and return its result.
+
+    The transaction starts with BEGIN IMMEDIATE, so the write lock is taken
+    (waiting up to the connection's busy timeout) before anything is read,
+    and everything work() does commits or rolls back together. If the lock
+    still cannot be had, the transaction is rolled back and work() is run
+    again after a jittered, growing delay, up to SQLITE_WRITE_RETRIES times;
+    work() must therefore only touch the database. With SQLITE_SERIALIZE_WRITES
+    the threads of this process take turns on a lock instead of all waiting
+    in SQLite's busy handler.
+    """
+    config = current_app.config
+    if retries is None:
+        retries = config.get('SQLITE_WRITE_RETRIES', 3)
+    if serialize is None:
+        serialize = config.get('SQLITE_SERIALIZE_WRITES', False)
+    delay = config.get('SQLITE_RETRY_DELAY', 0.05)
+
+    for attempt in range(retries + 1):
+        if serialize:
+            _write_lock.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+                conn.execute('COMMIT')
+                return result
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        except sqlite3.OperationalError as e:
+            metrics.record_db_error(e)
+            if not is_busy_error(e) or attempt == retries:
+                raise
+        finally:
+            if serialize:
+                _write_lock.release()
+
+        metrics.DB_WRITE_RETRIES.inc()
+        # Full jitter keeps retrying writers from colliding again in lockstep
+        time.sleep(random.uniform(0, delay * 2 ** attempt))
+
+
 def init_app(app):
     """Register database functions with the Flask app."""
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,239 @@
+"""
+Streamed export of complete cases as a ZIP archive.
+
+Every selected case becomes one entry holding the case with all its notes
+(AERENDE_ANT) and logs (LOG). XML entries use the element structure read by
+``import_xml.parse_xml_file``, so an export can be unpacked and imported
+again; JSON entries hold the database rows as they are.
+
+The archive is produced incrementally: ``zipfile`` writes into a buffer
+that is emptied after every entry, so only one case at a time is held in
+memory and nothing is staged on disk.
+"""
+
+import datetime
+import io
+import sqlite3
+import xml.etree.ElementTree as ET
+import zipfile
+
+from app.utils.archive import ARCHIVE_SCHEMA, is_archive_attached
+from app.utils.jsonrows import encode_object, encode_record, encode_records, Raw
+from app.utils.codes import DIRECTION_CODES, STATUS_CODES, log_field
+
+EXPORT_FORMATS = ('xml', 'json')
+
+CASE_SQL = '''
+    SELECT a.*, r.REG_NAMN, h.HAND_NAMN, d.NAMN AS DOSS_NAMN, e.ENHT_NAMN
+    FROM {schema}.AERENDE a
+    LEFT JOIN REG r ON a.REG_ID = r.REG_ID
+    LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
+    LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
+    LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
+'''
+
+NOTES_SQL = '''
+    SELECT n.*, r.REG_NAMN, h.HAND_NAMN
+    FROM {schema}.AERENDE_ANT n
+    LEFT JOIN REG r ON n.REG_ID = r.REG_ID
+    LEFT JOIN HANDLAEGGARE h ON n.HAND_ID = h.HAND_ID
+    WHERE n.DNR = ?
+    ORDER BY n.LNR
+'''
+
+LOGS_SQL = '''
+    SELECT l.*, r.REG_NAMN
+    FROM {schema}.LOG l
+    LEFT JOIN REG r ON l.REG_ID = r.REG_ID
+    WHERE l.DNR = ?
+    ORDER BY l.LOGDAT, l.REG_ID
+'''
+
+
+def parse_filters(doss_nr=None, enht_kod=None, date_from=None, date_to=None):
+    """
+    Validate export filters given as strings. Raises ValueError on bad input.
+
+    The date range applies to the registration date (REGDAT) and is inclusive.
+    """
+    filters = {}
+    if doss_nr:
+        filters['doss_nr'] = int(doss_nr)
+    if enht_kod:
+        filters['enht_kod'] = enht_kod
+    if date_from:
+        filters['date_from'] = datetime.date.fromisoformat(date_from).isoformat()
+    if date_to:
+        filters['date_to'] = datetime.date.fromisoformat(date_to).isoformat()
+    return filters
+
+
+def _where(filters):
+    conditions, args = [], []
+    if 'doss_nr' in filters:
+        conditions.append('a.DOSS_NR = ?')
+        args.append(filters['doss_nr'])
+    if 'enht_kod' in filters:
+        conditions.append('a.ENHT_KOD = ?')
+        args.append(filters['enht_kod'])
+    if 'date_from' in filters:
+        conditions.append('a.REGDAT >= ?')
+        args.append(filters['date_from'])
+    if 'date_to' in filters:
+        conditions.append('a.REGDAT <= ?')
+        args.append(filters['date_to'])
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), args
+
+
+def _query(conn, query, args=()):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, args)
+    return [description[0] for description in cursor.description], cursor
+
+
+def _add(parent, tag, value):
+    if value is not None and value != '':
+        ET.SubElement(parent, tag).text = str(value)
+
+
+def _xml_datetime(value):
+    """A LOGDAT (YYYY-MM-DD HH:MM:SS, or only the date) in the XML form YYYY-MM-DDThh:mm:ss."""
+    return value.replace(' ', 'T', 1) if isinstance(value, str) else value
+
+
+def case_to_xml(case, notes, logs):
+    """Build the XML document for one case from dict rows (see CASE_SQL, NOTES_SQL, LOGS_SQL)."""
+    root = ET.Element('Export')
+    element = ET.SubElement(root, 'AErende')
+    _add(element, 'Diarienummer', case['DNR'])
+    _add(element, 'Riktning', DIRECTION_CODES.get(case['IN_UT'], ''))
+    _add(element, 'AErendemening', case['ATEXT'])
+    _add(element, 'Status', STATUS_CODES.get(case['STAT'], ''))
+    _add(element, 'Inkomst_uppraettat_datum', case['INKUPP'])
+    _add(element, 'Registreringsdatum', case['REGDAT'])
+    _add(element, 'Avslutsdatum', case['AVSDAT'])
+    _add(element, 'Motpartens_beteckning', case['MOTPART_BET'])
+    _add(element, 'Fraan_till', case['FRAN_TILL'])
+    _add(element, 'Registrator', case['REG_NAMN'])
+    _add(element, 'Handlaeggare', case['HAND_NAMN'])
+
+    if case['DOSS_NR'] is not None:
+        diarieplan = ET.SubElement(element, 'Diarieplan')
+        _add(diarieplan, 'Dossiernummer', case['DOSS_NR'])
+        _add(diarieplan, 'Rubrik', case['DOSS_NAMN'])
+
+    if case['ENHT_KOD']:
+        ET.SubElement(element, 'Enhet', ID=case['ENHT_KOD']).text = case['ENHT_NAMN']
+
+    for note in notes:
+        haendelse = ET.SubElement(element, 'Haendelse')
+        _add(haendelse, 'Loepnummer', note['LNR'])
+        _add(haendelse, 'Riktning', DIRECTION_CODES.get(note['IN_UT'], ''))
+        _add(haendelse, 'Haendelsetext', note['ANT_TEXT'])
+        _add(haendelse, 'Inkommandedatum', note['DATUMIN'])
+        _add(haendelse, 'Utgaaendedatum', note['DATUMUT'])
+        _add(haendelse, 'Motpart', note['AVSMOT'])
+        _add(haendelse, 'Registrator', note['REG_NAMN'])
+        _add(haendelse, 'Handlaeggare', note['HAND_NAMN'])
+
+    for log in logs:
+        logg = ET.SubElement(element, 'Logg')
+        # The whole timestamp: LOG is keyed on it together with the registrator
+        _add(logg, 'AEndringsdatum', _xml_datetime(log['LOGDAT']))
+        field = log_field(log['LOGFLT'])
+        if field is None:
+            _add(logg, 'Loggtext', log['LOGFLT'])
+        else:
+            _add(logg, 'Faeltnamn', field)
+        _add(logg, 'Registrator', log['REG_NAMN'])
+
+    ET.indent(root)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True) + b'\n'
+
+
+def iter_case_documents(conn, filters=None, fmt='xml', include_archived=False):
+    """
+    Yield (entry name, document bytes) for every case matching the filters.
+
+    The matching DNRs are read up front and each case is then fetched with
+    short primary key lookups, so no statement (and no read lock) stays open
+    while the previous entry is being sent to a slow client.
+    """
+    where, args = _where(filters or {})
+    schemas = ['main']
+    if include_archived and is_archive_attached(conn):
+        schemas.append(ARCHIVE_SCHEMA)
+
+    for schema in schemas:
+        _, cursor = _query(conn, f'SELECT a.DNR FROM {schema}.AERENDE a{where} ORDER BY a.DNR', args)
+        dnrs = [dnr for (dnr,) in cursor]
+
+        for dnr in dnrs:
+            case_columns, cursor = _query(conn, CASE_SQL.format(schema=schema) + ' WHERE a.DNR = ?', (dnr,))
+            case_row = cursor.fetchone()
+            if case_row is None:
+                # Deleted or archived since the DNRs were read
+                continue
+            note_columns, cursor = _query(conn, NOTES_SQL.format(schema=schema), (dnr,))
+            notes = cursor.fetchall()
+            log_columns, cursor = _query(conn, LOGS_SQL.format(schema=schema), (dnr,))
+            logs = cursor.fetchall()
+
+            if fmt == 'json':
+                document = encode_object([
+                    ('archived', schema != 'main'),
+                    ('case', Raw(encode_record(case_columns, case_row))),
+                    ('notes', Raw(encode_records(note_columns, notes))),
+                    ('logs', Raw(encode_records(log_columns, logs)))
+                ]).encode('utf-8')
+            else:
+                document = case_to_xml(
+                    dict(zip(case_columns, case_row)),
+                    [dict(zip(note_columns, note)) for note in notes],
+                    [dict(zip(log_columns, log)) for log in logs]
+                )
+            yield f'case_{dnr}.{fmt}', document
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """A write-only, unseekable file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(documents):
+    """
+    Yield the bytes of a ZIP archive containing the given (name, bytes) entries.
+
+    Since the output cannot be seeked, each entry's sizes and CRC follow its
+    data in a data descriptor, which all common unzip tools understand.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in documents:
+            info = zipfile.ZipInfo(name, date_time=datetime.datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    yield buffer.drain()
+
+
+def stream_export(conn: sqlite3.Connection, filters=None, fmt='xml', include_archived=False):
+    """Yield a ZIP archive of the matching cases, one chunk per case."""
+    return iter_zip(iter_case_documents(conn, filters, fmt, include_archived))
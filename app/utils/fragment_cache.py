@@ -0,0 +1,41 @@
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """
+    A bounded, thread-safe LRU cache for rendered template fragments.
+
+    Keys must change whenever the underlying data changes (e.g. include a
+    revision number); entries are never invalidated explicitly.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """Return the cached fragment for key, rendering and storing it on a miss."""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                return fragment
+
+        # Render outside the lock; two threads may render the same row at once
+        fragment = render()
+
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,73 @@
+"""
+Direct JSON encoding of query results.
+
+Rows are encoded straight from the tuples returned by the cursor, using the
+column names from ``cursor.description``, so a result set is never copied
+into intermediate dicts before being serialized. If ``orjson`` is installed
+it is used for value encoding, otherwise the standard library encoder is used.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Encode a value as a JSON string."""
+        return orjson.dumps(obj, default=str).decode('utf-8')
+else:
+    dumps = _encoder.encode
+
+
+def _key_prefixes(columns):
+    """Pre-encode '"column":' once per result set instead of once per row."""
+    return [dumps(name) + ':' for name in columns]
+
+
+def encode_record(columns, row, prefixes=None):
+    """Encode a single row tuple as a JSON object."""
+    if row is None:
+        return 'null'
+    prefixes = prefixes or _key_prefixes(columns)
+    return '{' + ','.join([prefix + dumps(value) for prefix, value in zip(prefixes, row)]) + '}'
+
+
+def encode_records(columns, rows):
+    """Encode row tuples as a JSON array of objects."""
+    prefixes = _key_prefixes(columns)
+    return '[' + ','.join([encode_record(columns, row, prefixes) for row in rows]) + ']'
+
+
+def encode_columnar(columns, rows):
+    """Encode row tuples in columnar form: a column list plus one array per row."""
+    return '{"columns":' + dumps(list(columns)) + ',"rows":' + dumps(rows) + '}'
+
+
+def encode_object(fields):
+    """
+    Assemble a JSON object from (key, value) pairs.
+
+    Values that are already encoded JSON fragments should be wrapped in
+    ``Raw`` so they are inserted verbatim.
+    """
+    parts = []
+    for key, value in fields:
+        encoded = value.text if isinstance(value, Raw) else dumps(value)
+        parts.append(dumps(key) + ':' + encoded)
+    return '{' + ','.join(parts) + '}'
+
+
+class Raw:
+    """Marker for a pre-encoded JSON fragment."""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
@@ -0,0 +1,246 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are recorded into per-thread shards: every thread
+updates only its own dicts, so recording takes no lock and threads never
+contend. The shards are summed when the metrics are rendered, which happens
+only when ``/metrics`` is scraped. The shards of threads that have finished
+(the threaded development server starts one per request) are folded into a
+base total, both when rendering and whenever the number of shards has
+doubled, so their number stays close to the number of live threads.
+
+Metrics are module-level objects so they can be recorded from anywhere,
+including the command line tools, without an application context.
+"""
+
+import bisect
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; suitable for both request and query latencies
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Shards kept before the first check for finished threads
+MIN_PRUNE_SHARDS = 64
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # Thread -> shard, and the totals of threads that have finished
+        self._shards = {}
+        self._base = {}
+        self._prune_at = MIN_PRUNE_SHARDS
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        """The calling thread's shard; the lock is only taken the first time a thread records."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                if len(self._shards) >= self._prune_at:
+                    self._prune()
+                self._shards[threading.current_thread()] = shard
+            return shard
+
+    def _prune(self):
+        """Fold the shards of finished threads into the base total. Called with the lock held."""
+        for thread in [thread for thread in self._shards if not thread.is_alive()]:
+            for labels, value in self._shards.pop(thread).items():
+                self._fold(self._base, labels, value)
+        self._prune_at = max(MIN_PRUNE_SHARDS, 2 * len(self._shards))
+
+    def _snapshot(self):
+        with self._shards_lock:
+            self._prune()
+            shards = list(self._shards.values())
+            base = {}
+            for labels, value in self._base.items():
+                self._fold(base, labels, value)
+        # Copy each shard; its owner thread may add a label set meanwhile
+        return [base] + [dict(shard) for shard in shards]
+
+    def _totals(self):
+        totals = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                self._fold(totals, labels, value)
+        return totals
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    type = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _fold(totals, labels, value):
+        totals[labels] = totals.get(labels, 0) + value
+
+    def value(self, labels=()):
+        return sum(shard.get(labels, 0) for shard in self._snapshot())
+
+    def _samples(self):
+        for labels, value in sorted(self._totals().items()):
+            yield f'{self.name}{self._label_text(labels)} {_number(value)}'
+
+
+class Gauge(_Metric):
+    """A value that is set rather than accumulated, e.g. the throughput of the last run."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def value(self, labels=()):
+        return self._values.get(labels)
+
+    def _samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{self._label_text(labels)} {_number(value)}'
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, plus their sum and count."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # One count per bucket plus +Inf, then the sum
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @staticmethod
+    def _fold(totals, labels, state):
+        total = totals.setdefault(labels, [0] * len(state))
+        for i, value in enumerate(state):
+            total[i] += value
+
+    def count(self, labels=()):
+        return sum(sum(shard[labels][:-1]) for shard in self._snapshot() if labels in shard)
+
+    def _samples(self):
+        for labels, state in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                yield f'{self.name}_bucket{self._label_text(labels, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{self._label_text(labels)} {_number(state[-1])}'
+            yield f'{self.name}_count{self._label_text(labels)} {cumulative}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics(metrics=None):
+    """Render metrics (by default all registered ones) in the text exposition format."""
+    return '\n'.join(metric.render() for metric in (metrics or REGISTRY)) + '\n'
+
+
+# Web requests
+REQUESTS = register(Counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status.',
+    ('endpoint', 'method', 'status')))
+REQUEST_DURATION = register(Histogram(
+    'http_request_duration_seconds', 'Time to handle a request, including streaming the response.',
+    ('endpoint',)))
+
+# Database access through the blueprint helpers
+DB_CONNECTIONS = register(Counter(
+    'db_connections_opened_total', 'SQLite connections opened by the request helpers.', ('blueprint',)))
+DB_QUERY_DURATION = register(Histogram(
+    'db_query_duration_seconds', 'Time to execute a query and fetch its rows.', ('blueprint',)))
+DB_ROWS = register(Counter(
+    'db_rows_returned_total', 'Rows returned by queries.', ('blueprint',)))
+DB_ERRORS = register(Counter(
+    'db_errors_total', 'SQLite errors, by kind (busy, locked or other).', ('kind',)))
+DB_WRITE_RETRIES = register(Counter(
+    'db_write_retries_total', 'Write transactions retried because the database was locked.'))
+
+# Logins
+LOGINS = register(Counter(
+    'logins_total', 'Login attempts by result (ok, failed or busy).', ('result',)))
+PASSWORD_HASH_DURATION = register(Histogram(
+    'password_hash_duration_seconds', 'Time to verify or compute a password hash on the worker pool.',
+    ('operation',)))
+
+# XML import
+IMPORT_CASES = register(Counter(
+    'import_cases_total', 'Cases processed by import_xml.py, by result.', ('result',)))
+IMPORT_CASE_DURATION = register(Histogram(
+    'import_case_duration_seconds', 'Time to parse and import one case file.'))
+IMPORT_THROUGHPUT = register(Gauge(
+    'import_throughput_cases_per_second', 'Cases imported per second in the last import run.'))
+
+
+_LOCK_ERROR = re.compile(r'\b(locked|busy)\b')
+
+
+def record_db_error(error):
+    """Count an sqlite3 error, classifying "database is locked" / busy errors separately."""
+    match = _LOCK_ERROR.search(str(error).lower())
+    DB_ERRORS.inc(labels=(match.group(1) if match else 'other',))
+
+
+@contextmanager
+def db_timer(blueprint):
+    """Time a query for DB_QUERY_DURATION and count the sqlite3 errors it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except sqlite3.Error as e:
+        record_db_error(e)
+        raise
+    finally:
+        DB_QUERY_DURATION.observe(time.perf_counter() - start, labels=(blueprint,))
@@ -0,0 +1,201 @@
+"""
+Name resolution for handlers (HANDLAEGGARE) and registrators (REG).
+
+A ``NameIndex`` answers two questions without scanning the table:
+
+- exact lookup on the normalized name (case, Unicode form and whitespace
+  are ignored), a single dict access;
+- similarity search over word trigrams. Every word is padded as in
+  PostgreSQL's pg_trgm ("  anna ") and entries are scored by Jaccard
+  similarity of the trigram sets. A minimum score implies a minimum number
+  of shared trigrams, so candidates only need to be collected from the
+  postings of the query's rarest trigrams (prefix filtering); common
+  trigrams such as "  a" are never scanned.
+
+Results are ordered by score, then normalized name, then key, so the same
+data always gives the same answer. Substring matching is deliberately not
+used: "Ann" must not resolve to "Johanna".
+
+``TableNameIndex`` keeps an index over a table and rebuilds it when the
+table has changed since it was built. Changes are counted per table in
+NAMN_REV by the triggers in NAME_REVISION_SQL, so inserts, renames and
+deletes made by any process are all noticed.
+"""
+
+import heapq
+import math
+import sqlite3
+import threading
+import unicodedata
+
+# Tables with a TableNameIndex; NAMN_REV counts the writes to each of them
+NAME_TABLES = ('REG', 'HANDLAEGGARE')
+
+
+def name_revision_sql(tables=NAME_TABLES):
+    """Statements creating NAMN_REV and the triggers that bump it; all are idempotent."""
+    statements = [
+        'CREATE TABLE IF NOT EXISTS NAMN_REV (TABELL TEXT PRIMARY KEY, REV INTEGER NOT NULL)'
+    ]
+    for table in tables:
+        statements.append(f"INSERT OR IGNORE INTO NAMN_REV (TABELL, REV) VALUES ('{table}', 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            statements.append(
+                f'CREATE TRIGGER IF NOT EXISTS NAMN_REV_{table}_{event} AFTER {event} ON {table}\n'
+                f"BEGIN UPDATE NAMN_REV SET REV = REV + 1 WHERE TABELL = '{table}'; END"
+            )
+    return statements
+
+
+NAME_REVISION_SQL = name_revision_sql()
+
+
+def normalize_name(name):
+    """Casefold, NFKC-normalize and collapse whitespace."""
+    return ' '.join(unicodedata.normalize('NFKC', name or '').casefold().split())
+
+
+def name_trigrams(normalized, prefix=False):
+    """
+    Trigrams of every word in an already normalized name.
+
+    With prefix=True the last word is not padded at the end, so a partly
+    typed word matches the start of longer words.
+    """
+    words = normalized.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = '  ' + word if prefix and i == len(words) - 1 else '  ' + word + ' '
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """In-memory exact and trigram index over (key, name) pairs."""
+
+    def __init__(self, entries=()):
+        self._names = {}
+        self._normalized = {}
+        self._grams = {}
+        self._exact = {}
+        self._postings = {}
+        for key, name in entries:
+            self.add(key, name)
+
+    @classmethod
+    def from_query(cls, conn, query):
+        """Build an index from a query returning (key, name) rows."""
+        return cls(tuple(row) for row in conn.execute(query))
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, key, name):
+        normalized = normalize_name(name)
+        self._names[key] = name
+        self._normalized[key] = normalized
+        # With duplicate names the smallest key wins, independent of load order
+        if normalized not in self._exact or key < self._exact[normalized]:
+            self._exact[normalized] = key
+        grams = frozenset(name_trigrams(normalized))
+        self._grams[key] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def lookup(self, name):
+        """The key of the entry with the same normalized name, or None."""
+        return self._exact.get(normalize_name(name))
+
+    def search(self, query, limit=10, min_score=0.0, prefix=False):
+        """
+        Return up to limit (key, name, score) tuples, best first.
+
+        The score is the Jaccard similarity of the trigram sets. With
+        prefix=True (typeahead) the last word of the query may be incomplete
+        and entries are ranked by how much of the query they contain, with
+        the Jaccard similarity as tie-breaker.
+        """
+        normalized = normalize_name(query)
+        grams = name_trigrams(normalized, prefix=prefix)
+        if not grams:
+            return []
+
+        # Both scores are at most shared / len(grams), so an entry needs at
+        # least `need` shared trigrams and must occur in one of the postings
+        # of the len(grams) - need + 1 rarest query trigrams
+        need = max(1, math.ceil(min_score * len(grams) - 1e-9))
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*postings[:len(grams) - need + 1])
+
+        results = []
+        for key in candidates:
+            other = self._grams[key]
+            common = len(grams & other)
+            jaccard = common / (len(grams) + len(other) - common)
+            score = common / len(grams) if prefix else jaccard
+            if score >= min_score:
+                results.append((-score, -jaccard, self._normalized[key], key))
+        return [(key, self._names[key], round(-score, 4))
+                for score, _, _, key in heapq.nsmallest(limit, results)]
+
+    def resolve(self, name, min_score=0.8):
+        """
+        The key for a name: an exact normalized match, otherwise the most
+        similar entry scoring at least min_score, otherwise None.
+        """
+        key = self.lookup(name)
+        if key is not None:
+            return key
+        matches = self.search(name, limit=1, min_score=min_score)
+        return matches[0][0] if matches else None
+
+
+class TableNameIndex:
+    """
+    A NameIndex over the (key, name) columns of a table, kept in sync cheaply.
+
+    Before use, the database file and the table's NAMN_REV counter are
+    compared with those the index was built from, and the index is rebuilt
+    when they differ. In a database without NAMN_REV (not yet migrated) the
+    row count and highest rowid are used instead, which miss renames.
+    """
+
+    def __init__(self, table, key_column, name_column):
+        self.table = table
+        self.query = f'SELECT {key_column}, {name_column} FROM {table}'
+        self._stamp = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _current_stamp(self, conn):
+        path = conn.execute('PRAGMA database_list').fetchone()[2]
+        try:
+            row = conn.execute('SELECT REV FROM NAMN_REV WHERE TABELL = ?', (self.table,)).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is not None:
+            return path, row[0]
+        return path, conn.execute(f'SELECT COUNT(*), MAX(rowid) FROM {self.table}').fetchone()
+
+    def get(self, conn):
+        """The up-to-date NameIndex for the table in this connection's database."""
+        stamp = self._current_stamp(conn)
+        with self._lock:
+            if self._index is None or self._stamp != stamp:
+                self._index = NameIndex.from_query(conn, self.query)
+                self._stamp = stamp
+            return self._index
+
+    def added(self, conn, key, name):
+        """Record a row just inserted through conn without rebuilding the whole index."""
+        stamp = self._current_stamp(conn)
+        with self._lock:
+            if self._index is None:
+                return
+            # Only patch the index if this insert is the only change since it was built
+            path, rev = self._stamp
+            if stamp[0] == path and isinstance(rev, int) and stamp[1] == rev + 1:
+                self._index.add(key, name)
+                self._stamp = stamp
+            else:
+                self._index = None
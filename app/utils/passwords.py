@@ -0,0 +1,105 @@
+"""
+Password hashing on a bounded pool of threads.
+
+Checking a scrypt or PBKDF2 hash deliberately costs tens of milliseconds
+of CPU. When a whole shift logs in at once and every request thread hashes
+inline, the hashing takes all cores and case traffic stalls behind it.
+``PasswordHasher`` runs all hashing on PASSWORD_HASH_WORKERS threads, so at
+most that many hashes are computed at once per process however many clerks
+log in; hashlib releases the interpreter lock while hashing, so the other
+request threads keep running meanwhile. At most PASSWORD_HASH_QUEUE logins
+wait for a worker, further ones are turned away with ``HasherBusy``
+instead of piling up.
+
+Stored hashes record their method and cost (``scrypt:32768:8:1$salt$hash``);
+``needs_rehash`` tells whether a hash was made with other parameters than
+PASSWORD_HASH_METHOD, so it can be replaced at the next successful login.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from app.utils import metrics
+
+# werkzeug's scrypt parameters (n, r, p) when the method is just "scrypt"
+SCRYPT_DEFAULTS = ('32768', '8', '1')
+
+
+class HasherBusy(Exception):
+    """Too many password hashes are already queued."""
+
+
+def canonical_method(method):
+    """
+    The method string werkzeug stores in hashes made with method, with
+    default parameters filled in: "scrypt" -> "scrypt:32768:8:1".
+    Raises ValueError for methods werkzeug does not support.
+    """
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = SCRYPT_DEFAULTS
+    elif name == 'pbkdf2':
+        defaults = ('sha256', str(DEFAULT_PBKDF2_ITERATIONS))
+    else:
+        raise ValueError(f'Unsupported password hash method {method!r}')
+    if len(params) > len(defaults):
+        raise ValueError(f'Unsupported password hash method {method!r}')
+    return ':'.join([name, *params, *defaults[len(params):]])
+
+
+def default_workers():
+    """Half the CPUs, so hashing never takes all cores from the request threads."""
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class PasswordHasher:
+    """Hash and verify passwords on a fixed number of worker threads."""
+
+    def __init__(self, method='scrypt', workers=None, queue=32):
+        self.method = method
+        self.canonical = canonical_method(method)
+        workers = workers or default_workers()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        # One slot per running or waiting hash
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                   config.get('PASSWORD_HASH_WORKERS'),
+                   config.get('PASSWORD_HASH_QUEUE', 32))
+
+    def _run(self, operation, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor.submit(self._timed, operation, function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    @staticmethod
+    def _timed(operation, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, labels=(operation,))
+
+    def verify(self, pwhash, password):
+        """True if password matches the stored hash. Raises HasherBusy if the queue is full."""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def hash(self, password):
+        """A new hash of password with the configured method. Raises HasherBusy if the queue is full."""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def needs_rehash(self, pwhash):
+        """True if the stored hash was made with another method or cost than the configured one."""
+        return pwhash.split('$', 1)[0] != self.canonical
@@ -0,0 +1,161 @@
+"""
+Rate limiting and admission control for the API.
+
+Each API request takes a token from one bucket: the logged-in user's, or
+for anonymous requests the client address's (clerks behind one NAT address
+must not share a bucket). A bucket holds up to ``burst`` tokens and is
+refilled at ``rate`` tokens per second. When it is empty the request is
+answered with 429 and a Retry-After header instead of reaching the database.
+The typeahead and timeline calls made by the web pages themselves (see
+``INTERACTIVE_ENDPOINTS`` in app/routes/api.py) take from a separate, larger
+bucket per user, created from the API_UI_* settings.
+
+Expensive endpoints are additionally wrapped in ``limit_concurrency``, which
+caps how many of them may run at once per process. That keeps worker
+threads free for the interactive views, which are not rate limited.
+
+Bucket state is kept in process memory. If the optional ``redis`` package is
+installed and RATELIMIT_REDIS_URL is set, the buckets are kept in Redis
+instead so that several processes share one limit.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from flask import current_app, jsonify, make_response
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+
+class TokenBucketLimiter:
+    """In-process token buckets, keyed by an arbitrary string."""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take one token. Returns 0 on success, else the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+class RedisTokenBucketLimiter:
+    """Token buckets stored in Redis, shared by all processes using the same server."""
+
+    # Refill and take a token atomically; returns the wait in milliseconds
+    SCRIPT = '''
+        local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate / 1000)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = math.ceil((1 - tokens) * 1000 / rate)
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+        return wait
+    '''
+
+    def __init__(self, url, rate, burst, prefix='ratelimit:'):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def acquire(self, key):
+        now = int(time.time() * 1000)
+        wait_ms = self._script(keys=[self.prefix + key], args=[self.rate, self.burst, now])
+        return int(wait_ms) / 1000
+
+
+def create_limiter(config, prefix='API'):
+    """
+    Create the limiter described by the app config settings <prefix>_RATE_LIMIT
+    and <prefix>_RATE_BURST, or None if that rate limiting is disabled.
+    """
+    rate = config.get(f'{prefix}_RATE_LIMIT', 0)
+    if not rate:
+        return None
+    burst = config.get(f'{prefix}_RATE_BURST') or rate
+    url = config.get('RATELIMIT_REDIS_URL')
+    if url:
+        if redis is None:
+            raise RuntimeError('RATELIMIT_REDIS_URL is set but the redis package is not installed')
+        return RedisTokenBucketLimiter(url, rate, burst)
+    return TokenBucketLimiter(rate, burst)
+
+
+def too_many_requests(retry_after, message='Too many requests'):
+    """A JSON 429 response with a Retry-After header in whole seconds."""
+    response = jsonify({'status': 'error', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_rate_limit(limiter, keys):
+    """Take a token for every key; return a 429 response if any bucket is empty, else None."""
+    wait = max(limiter.acquire(key) for key in keys)
+    if wait > 0:
+        return too_many_requests(wait)
+    return None
+
+
+def limit_concurrency(view):
+    """
+    Let at most API_MAX_CONCURRENT calls of the view run at once in this process.
+
+    Callers that do not get a slot within API_CONCURRENCY_WAIT seconds get a
+    429. For streamed responses the slot is held until the stream is closed.
+    """
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        gate = current_app.extensions.get('api_concurrency_gate')
+        if gate is None:
+            return view(*args, **kwargs)
+
+        if not gate.acquire(timeout=current_app.config.get('API_CONCURRENCY_WAIT', 0.5)):
+            return too_many_requests(1, 'Server busy, try again later')
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            gate.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(gate.release)
+        else:
+            gate.release()
+        return response
+    return wrapped
@@ -0,0 +1,148 @@
+"""
+Schema bootstrap for the SQLite database.
+
+The schema version is stored in ``PRAGMA user_version``. On startup
+``schema_is_current`` reads it (a single cheap query); only when it is behind
+``SCHEMA_VERSION`` are the migration steps applied, inside one write
+transaction so concurrently starting workers migrate exactly once. All steps
+are non-destructive and idempotent, so databases created before versioning
+was introduced (user_version 0) are brought up to date safely.
+"""
+
+import os
+import sqlite3
+
+BASEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+SCHEMA_SQL_PATH = os.path.join(BASEDIR, 'schema.sql')
+
+
+def execute_sql_file(conn: sqlite3.Connection, path: str) -> None:
+    """
+    Execute the statements in an SQL file one by one.
+
+    Unlike ``executescript`` this does not commit, so the statements become
+    part of the caller's transaction.
+    """
+    with open(path, 'r') as f:
+        statement = ''
+        for line in f:
+            statement += line
+            if sqlite3.complete_statement(statement):
+                conn.execute(statement)
+                statement = ''
+    if statement.strip() and not statement.strip().startswith('--'):
+        raise sqlite3.ProgrammingError(f'Incomplete statement at end of {path}')
+
+
+def _create_base_schema(conn):
+    execute_sql_file(conn, SCHEMA_SQL_PATH)
+
+
+def _create_case_summary(conn):
+    from app.utils.case_summary import ensure_case_summary
+    ensure_case_summary(conn, commit=False)
+
+
+def _add_work_queue(conn):
+    # AERENDE_LISTA.SENAST, the LOG triggers and the work queue indexes
+    from app.utils.case_summary import upgrade_case_summary
+    upgrade_case_summary(conn, commit=False)
+
+
+def _add_timeline_indexes(conn):
+    # Indexes for paging through a case's notes and log entries by date
+    from app.utils.timeline import TIMELINE_INDEXES
+    for statement in TIMELINE_INDEXES:
+        conn.execute(statement)
+
+
+def _add_summary_rev_counter(conn):
+    # AERENDE_LISTA_REV and the triggers that take REV from it
+    from app.utils.case_summary import upgrade_case_summary
+    upgrade_case_summary(conn, commit=False)
+
+
+def _add_name_revisions(conn):
+    # NAMN_REV and its triggers, so the name indexes notice renames
+    from app.utils.names import NAME_REVISION_SQL
+    for statement in NAME_REVISION_SQL:
+        conn.execute(statement)
+
+
+# (version, step) pairs; append new steps with increasing versions
+MIGRATIONS = [
+    (1, _create_base_schema),
+    (2, _create_case_summary),
+    (3, _add_work_queue),
+    (4, _add_timeline_indexes),
+    (5, _add_summary_rev_counter),
+    (6, _add_name_revisions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def schema_is_current(db_path: str) -> bool:
+    """Return True if the database exists and is at SCHEMA_VERSION."""
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        return get_schema_version(conn) >= SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def ensure_journal_mode(db_path: str, mode: str, timeout: float = 30) -> str:
+    """
+    Switch the database to the given journal mode (e.g. 'wal') if needed.
+
+    The mode is stored in the database file, so this only writes the first
+    time. Returns the journal mode in effect.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    try:
+        current = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        if current.lower() != mode.lower():
+            current = conn.execute(f'PRAGMA journal_mode = {mode}').fetchone()[0]
+        return current
+    finally:
+        conn.close()
+
+
+def migrate_schema(db_path: str, model_ddl=()) -> list:
+    """
+    Bring the database up to SCHEMA_VERSION. Returns the versions applied.
+
+    The write lock is taken before the version is re-read, so when several
+    processes start at once only the first one runs the migrations.
+    model_ddl are idempotent statements for tables owned by SQLAlchemy
+    models; they run in the same transaction whenever migrations do.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    applied = []
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = get_schema_version(conn)
+            if version < SCHEMA_VERSION:
+                for statement in model_ddl:
+                    conn.execute(statement)
+            for step_version, step in MIGRATIONS:
+                if step_version > version:
+                    step(conn)
+                    applied.append(step_version)
+            if applied:
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION:d}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    return applied
@@ -0,0 +1,118 @@
+"""
+Queries for a case's timeline: notes (AERENDE_ANT) and log entries (LOG)
+merged into one stream, newest first.
+
+Events are ordered by (DATUM, KIND, key) descending, where the key is LNR
+for notes and REG_ID for log entries, which makes the order total. Pages
+are fetched with keyset pagination: the cursor is the position of the last
+event of the previous page and every branch of the query only reads the
+events after it. With the indexes in TIMELINE_INDEXES each branch is a
+descending range scan that stops after one page, so the cost of a page does
+not depend on how many events the case has. Dates are compared through
+IFNULL(..., '') (events without a date come last), and the index
+expressions must stay identical to the ones in the queries for SQLite to
+use them.
+"""
+
+import base64
+import binascii
+import json
+
+KINDS = ('log', 'note')
+
+TIMELINE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS IDX_AERENDE_ANT_TIDSLINJE ON AERENDE_ANT (DNR, IFNULL(DATUMIN, ''), LNR)",
+    "CREATE INDEX IF NOT EXISTS IDX_LOG_TIDSLINJE ON LOG (DNR, IFNULL(LOGDAT, ''), IFNULL(REG_ID, ''))",
+]
+
+# Both branches return the same columns; KIND, DATUM, LNR and REG_ID identify an event
+NOTES_SQL = '''
+    SELECT 'note' AS KIND, IFNULL(n.DATUMIN, '') AS DATUM, n.LNR, n.REG_ID, r.REG_NAMN, n.IN_UT,
+           n.ANT_TEXT AS TEXT, n.DATUMUT, n.HAND_ID, h.HAND_NAMN, n.AVSMOT
+    FROM {schema}.AERENDE_ANT n
+    LEFT JOIN REG r ON n.REG_ID = r.REG_ID
+    LEFT JOIN HANDLAEGGARE h ON n.HAND_ID = h.HAND_ID
+    WHERE n.DNR = ?{after}
+    ORDER BY IFNULL(n.DATUMIN, '') DESC, n.LNR DESC
+    LIMIT ?
+'''
+
+LOGS_SQL = '''
+    SELECT 'log' AS KIND, IFNULL(l.LOGDAT, '') AS DATUM, NULL AS LNR, l.REG_ID, r.REG_NAMN, NULL AS IN_UT,
+           l.LOGFLT AS TEXT, NULL AS DATUMUT, NULL AS HAND_ID, NULL AS HAND_NAMN, NULL AS AVSMOT
+    FROM {schema}.LOG l
+    LEFT JOIN REG r ON l.REG_ID = r.REG_ID
+    WHERE l.DNR = ?{after}
+    ORDER BY IFNULL(l.LOGDAT, '') DESC, IFNULL(l.REG_ID, '') DESC
+    LIMIT ?
+'''
+
+# (query, date expression, key expression) per kind
+BRANCHES = {
+    'note': (NOTES_SQL, "IFNULL(n.DATUMIN, '')", 'n.LNR'),
+    'log': (LOGS_SQL, "IFNULL(l.LOGDAT, '')", "IFNULL(l.REG_ID, '')"),
+}
+
+
+def encode_cursor(position):
+    """Opaque cursor for a (DATUM, KIND, key) position."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The (DATUM, KIND, key) position of a cursor. Raises ValueError if it is not valid."""
+    try:
+        date, kind, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    if kind not in KINDS or not isinstance(date, str) or (kind == 'note') != isinstance(key, int):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return date, kind, key
+
+
+def parse_kinds(kind=None):
+    """The event kinds to include: all for None/empty, else one of KINDS. Raises ValueError."""
+    if not kind:
+        return KINDS
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind {kind!r}, expected one of {", ".join(KINDS)}')
+    return (kind,)
+
+
+def timeline_query(dnr, schema='main', kinds=KINDS, before=None, limit=50):
+    """
+    SQL and arguments for up to limit + 1 events of a case, newest first,
+    starting after the cursor before (see decode_cursor). The extra row
+    tells page() whether there is a next page.
+    """
+    selects, args = [], []
+    for kind in kinds:
+        query, date_expr, key_expr = BRANCHES[kind]
+        after, after_args = '', []
+        if before is not None:
+            date, cursor_kind, key = before
+            # Events sort after the cursor when (DATUM, KIND, key) is smaller
+            if kind < cursor_kind:
+                after, after_args = f' AND {date_expr} <= ?', [date]
+            elif kind > cursor_kind:
+                after, after_args = f' AND {date_expr} < ?', [date]
+            else:
+                # The separate date bound lets SQLite seek in the index; it does
+                # not use the row value comparison for that
+                after = f' AND {date_expr} <= ? AND ({date_expr}, {key_expr}) < (?, ?)'
+                after_args = [date, date, key]
+        selects.append(f'SELECT * FROM ({query.format(schema=schema, after=after)})')
+        args += [dnr, *after_args, limit + 1]
+
+    sql = (f"SELECT * FROM ({' UNION ALL '.join(selects)})"
+           " ORDER BY DATUM DESC, KIND DESC, IFNULL(LNR, IFNULL(REG_ID, '')) DESC LIMIT ?")
+    return sql, args + [limit + 1]
+
+
+def page(rows, limit):
+    """Split rows fetched with timeline_query into (this page's rows, cursor of the next page or None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    kind, date, lnr, reg_id = rows[-1][0], rows[-1][1], rows[-1][2], rows[-1][3]
+    return rows, encode_cursor([date, kind, lnr if kind == 'note' else reg_id or ''])
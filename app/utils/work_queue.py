@@ -0,0 +1,34 @@
+"""
+Queries for a handler's personal work queue.
+
+All of them filter on AERENDE_LISTA.HAND_ID and are served by the work queue
+indexes in case_summary.sql, so they read only the handler's own cases and
+never scan the whole register. The STAT condition must stay exactly
+"STAT IS NOT 'Avslutad'" for SQLite to use the partial index.
+"""
+
+# Open cases, newest first
+OPEN_CASES_SQL = '''
+    SELECT * FROM AERENDE_LISTA
+    WHERE HAND_ID = ? AND STAT IS NOT 'Avslutad'
+    ORDER BY REGDAT DESC
+    LIMIT ?
+'''
+
+# Number of open cases per status
+STATUS_COUNTS_SQL = '''
+    SELECT STAT, COUNT(*) AS ANTAL FROM AERENDE_LISTA
+    WHERE HAND_ID = ? AND STAT IS NOT 'Avslutad'
+    GROUP BY STAT
+    ORDER BY STAT
+'''
+
+# The handler's cases with the most recent log entries
+RECENT_CASES_SQL = '''
+    SELECT * FROM AERENDE_LISTA
+    WHERE HAND_ID = ? AND SENAST IS NOT NULL
+    ORDER BY SENAST DESC
+    LIMIT ?
+'''
+
+RECENT_LIMIT = 10
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Move closed cases to the archive database.
+
+Cases with STAT 'Avslutad' and an AVSDAT before the cutoff are moved, with
+their notes, logs and summary row, to a separate SQLite file that the web
+application attaches for viewing.
+Usage: python archive_cases.py --before 2020-01-01 [--dry-run] [--vacuum]
+"""
+
+import argparse
+import datetime
+import sqlite3
+
+from config import Config
+from app.utils.archive import archive_closed_cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move cases closed before a date to the archive database.')
+    parser.add_argument('--before', required=True, type=datetime.date.fromisoformat,
+                        help='Archive cases closed (AVSDAT) before this date, YYYY-MM-DD')
+    parser.add_argument('--db', default=Config.DATABASE_PATH,
+                        help='Path to the main SQLite database')
+    parser.add_argument('--archive', default=Config.ARCHIVE_DATABASE_PATH,
+                        help='Path to the archive SQLite database (created if missing)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only count the cases that would be archived')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='VACUUM the main database afterwards to release the freed space')
+    args = parser.parse_args()
+
+    count = archive_closed_cases(args.db, args.archive, args.before.isoformat(), dry_run=args.dry_run)
+
+    if args.dry_run:
+        print(f"Dry run - would archive {count} cases closed before {args.before}.")
+        return
+
+    print(f"Archived {count} cases closed before {args.before} to {args.archive}.")
+
+    if args.vacuum and count:
+        conn = sqlite3.connect(args.db, timeout=Config.SQLITE_BUSY_TIMEOUT)
+        conn.execute('VACUUM')
+        conn.close()
+        print("Main database vacuumed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Login burst benchmark.
+
+Starts the application against a temporary database with --users clerks,
+measures the latency of the case list for a few seconds, and then lets
+--concurrency threads log in --logins times as fast as they can (the start
+of a shift) while the case list keeps being requested. Reports login
+throughput and latency, logins turned away as busy, and the case list
+latency before and during the burst. The hashing parameters are passed to
+the server, so the effect of PASSWORD_HASH_METHOD and PASSWORD_HASH_WORKERS
+can be compared. Exits with status 1 if the case list p95 during the burst
+exceeds --max-probe-p95-ms.
+Usage: python benchmarks/bench_login.py [--logins 200] [--concurrency 50] [--users 100]
+       [--method scrypt] [--workers 2] [--queue 32] [--max-probe-p95-ms 250]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadtest import BASEDIR, Session, percentile, start_server  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+# Creates the clerks; all share one hash so setup does not pay the hashing cost per user
+SETUP_CHILD = '''
+import sys
+from app import create_app, db
+from app.models.user import User
+app = create_app()
+with app.app_context():
+    template = User(username='template')
+    template.set_password(sys.argv[2])
+    db.session.add_all(User(username=f'clerk{i}', password_hash=template.password_hash)
+                       for i in range(int(sys.argv[1])))
+    db.session.commit()
+'''
+
+
+class Probe(threading.Thread):
+    """Requests the case list in a loop as a logged-in clerk, recording (time, latency) pairs."""
+
+    def __init__(self, base_url, interval):
+        super().__init__(daemon=True)
+        self.session = Session(base_url, timeout=30)
+        self.session.login('clerk0', PASSWORD)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            self.session.request('/')
+            self.samples.append((start, time.perf_counter() - start))
+            self.stopped.wait(self.interval)
+
+    def latencies_ms(self, since, until):
+        return sorted(latency * 1000 for start, latency in self.samples if since <= start < until)
+
+
+def login_burst(base_url, logins, concurrency, users):
+    """Log in logins times from concurrency threads. Returns [(latency, outcome)]."""
+    results, lock = [], threading.Lock()
+    remaining = iter(range(logins))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(remaining, None)
+            if i is None:
+                return
+            session = Session(base_url, timeout=60)
+            start = time.perf_counter()
+            try:
+                status, url, _ = session.request('/auth/login', {'username': f'clerk{i % users}',
+                                                                 'password': PASSWORD})
+                if status == 503:
+                    outcome = 'busy'
+                elif status != 200 or urllib.parse.urlparse(url).path.startswith('/auth/login'):
+                    outcome = 'failed'
+                else:
+                    outcome = 'ok'
+            except (urllib.error.URLError, OSError):
+                outcome = 'network_error'
+            with lock:
+                results.append((time.perf_counter() - start, outcome))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def describe(latencies):
+    return (f"p50 {percentile(latencies, 0.50):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+            f"p99 {percentile(latencies, 0.99):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure login throughput and its effect on case traffic.')
+    parser.add_argument('--logins', type=int, default=200, help='Number of logins in the burst')
+    parser.add_argument('--concurrency', type=int, default=50, help='Threads logging in at once')
+    parser.add_argument('--users', type=int, default=100, help='Number of clerk accounts')
+    parser.add_argument('--method', default='scrypt', help='PASSWORD_HASH_METHOD for the server')
+    parser.add_argument('--workers', type=int, help='PASSWORD_HASH_WORKERS for the server')
+    parser.add_argument('--queue', type=int, help='PASSWORD_HASH_QUEUE for the server')
+    parser.add_argument('--baseline', type=float, default=3, help='Seconds of case list traffic before the burst')
+    parser.add_argument('--probe-interval', type=float, default=0.02,
+                        help='Pause between case list requests in seconds')
+    parser.add_argument('--max-probe-p95-ms', type=float,
+                        help='Exit with status 1 if the case list p95 during the burst exceeds this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, 'case_management.db'),
+                   ARCHIVE_DATABASE_PATH=os.path.join(tmp, 'case_archive.db'),
+                   PASSWORD_HASH_METHOD=args.method)
+        if args.workers is not None:
+            env['PASSWORD_HASH_WORKERS'] = str(args.workers)
+        if args.queue is not None:
+            env['PASSWORD_HASH_QUEUE'] = str(args.queue)
+        subprocess.run([sys.executable, '-c', SETUP_CHILD, str(args.users), PASSWORD],
+                       cwd=BASEDIR, env=env, check=True)
+
+        server, base_url = start_server(env)
+        try:
+            probe = Probe(base_url, args.probe_interval)
+            probe.start()
+            time.sleep(args.baseline)
+
+            burst_start = time.perf_counter()
+            results = login_burst(base_url, args.logins, args.concurrency, args.users)
+            burst_end = time.perf_counter()
+
+            probe.stopped.set()
+            probe.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    elapsed = burst_end - burst_start
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    logins = sorted(latency * 1000 for latency, outcome in results if outcome == 'ok')
+    before = probe.latencies_ms(0, burst_start)
+    during = probe.latencies_ms(burst_start, burst_end)
+
+    print(f"Method {args.method}, {args.logins} logins from {args.concurrency} threads in {elapsed:.2f} s: "
+          f"{outcomes.get('ok', 0) / elapsed:.1f} logins/s")
+    print(f"Login latency: {describe(logins)}; "
+          + ', '.join(f'{outcome}={count}' for outcome, count in sorted(outcomes.items())))
+    print(f"Case list before the burst ({len(before)} requests): {describe(before)}")
+    print(f"Case list during the burst ({len(during)} requests): {describe(during)}")
+
+    if args.max_probe_p95_ms is not None and percentile(during, 0.95) > args.max_probe_p95_ms:
+        print(f"Case list p95 {percentile(during, 0.95):.1f} ms exceeds {args.max_probe_p95_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for create_app.
+
+Starts fresh interpreter processes that import the application and call
+create_app() against a temporary database, and reports how long that takes:
+once for a cold bootstrap of an empty database and then repeatedly for warm
+starts against the migrated database (the worker recycling case).
+Exits with status 1 if the median warm start exceeds the budget.
+Usage: python benchmarks/bench_startup.py [--runs 10] [--budget-ms 1500]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def start_once(db_path):
+    """Run create_app in a new process. Returns (in-process ms, wall-clock ms)."""
+    env = dict(os.environ, DATABASE_PATH=db_path)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=BASEDIR, env=env,
+                            capture_output=True, text=True, check=True)
+    wall = (time.perf_counter() - start) * 1000
+    return float(result.stdout.strip().splitlines()[-1]), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure create_app cold and warm start times.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of warm starts')
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                        help='Maximum median warm start (in-process, ms)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'case_management.db')
+
+        cold, cold_wall = start_once(db_path)
+        print(f"Cold start (empty database): {cold:.1f} ms in process, {cold_wall:.1f} ms wall clock")
+
+        warm = [start_once(db_path) for _ in range(args.runs)]
+        in_process = sorted(t for t, _ in warm)
+        wall = sorted(w for _, w in warm)
+
+    median = statistics.median(in_process)
+    print(f"Warm start over {args.runs} runs: median {median:.1f} ms, "
+          f"max {in_process[-1]:.1f} ms in process; median {statistics.median(wall):.1f} ms wall clock")
+
+    if median > args.budget_ms:
+        print(f"Over budget: {median:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+    print(f"Within budget of {args.budget_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Load test for a running instance of the application.
+
+Worker threads each log in through /auth/login with their own cookie jar
+and then repeatedly pick an operation from a weighted mix of clerk and
+integration traffic: the case list, viewing a case, adding a note, editing
+a case (loading the form and submitting it unchanged) and the JSON API.
+At the end throughput, latency percentiles and error rates are reported per
+operation. If the server exposes /metrics, the SQLite lock errors and write
+retries recorded by the server during the run are reported as well.
+
+The API is rate limited per user, so with a single --username all workers
+share one bucket. Give --username a {i} placeholder (e.g. clerk{i}) to log
+each worker in as its own user, or set API_RATE_LIMIT=0 on the server to
+measure capacity rather than the limiter. Note that the test writes notes
+and log entries to the database it runs against; --serve runs the server
+on a temporary copy of the configured database (and archive), where the
+{i} users are created with --password if they do not exist.
+Usage: python benchmarks/loadtest.py --password secret [--url http://127.0.0.1:5000]
+       [--username admin] [--concurrency 8] [--duration 30]
+       [--mix index=30,view=35,note=10,edit=5,api_case=15,api_cases=5]
+       [--serve] [--json results.json] [--max-p95-ms 500] [--max-error-rate 0.01]
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BASEDIR)
+from config import Config  # noqa: E402
+
+DEFAULT_MIX = 'index=30,view=35,note=10,edit=5,api_case=15,api_cases=5'
+
+# Threaded development server for --serve, started in its own process so it
+# does not share the interpreter lock with the load generating threads
+SERVE_CHILD = '''
+import logging, sys
+from werkzeug.serving import make_server
+from app import create_app
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+server = make_server('127.0.0.1', int(sys.argv[1]), create_app(), threaded=True)
+print('ready', flush=True)
+server.serve_forever()
+'''
+
+# Creates the users named on the command line that do not exist yet; all
+# share one hash so setup does not pay the hashing cost per user
+CREATE_USERS_CHILD = '''
+import sys
+from app import create_app, db
+from app.models.user import User
+app = create_app()
+with app.app_context():
+    existing = {user.username for user in User.query.all()}
+    template = User(username='template')
+    template.set_password(sys.argv[1])
+    db.session.add_all(User(username=name, password_hash=template.password_hash)
+                       for name in sys.argv[2:] if name not in existing)
+    db.session.commit()
+'''
+
+# Messages flashed by the views when a database write fails
+LOCKED_MESSAGES = ('Databasen är upptagen', 'database is locked')
+ERROR_MESSAGE = 'Ett fel inträffade'
+
+
+class FormParser(HTMLParser):
+    """Collect the current values of the fields in an HTML form."""
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self._select = None
+        self._textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get('name')
+        if tag == 'input' and name and attrs.get('type') not in ('submit', 'button', 'checkbox'):
+            self.fields[name] = attrs.get('value') or ''
+        elif tag == 'select' and name:
+            self._select = name
+            self.fields.setdefault(name, None)
+        elif tag == 'option' and self._select:
+            value = attrs.get('value', '')
+            if self.fields[self._select] is None or 'selected' in attrs:
+                self.fields[self._select] = value
+        elif tag == 'textarea' and name:
+            self._textarea = name
+            self.fields[name] = ''
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+        elif tag == 'textarea':
+            self._textarea = None
+
+    def handle_data(self, data):
+        if self._textarea:
+            self.fields[self._textarea] += data
+
+
+class Session:
+    """One simulated user with its own cookies."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, path, data=None):
+        """Return (status, final URL, body). Redirects are followed."""
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=self.timeout) as response:
+                return response.status, response.geturl(), response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.geturl(), e.read().decode('utf-8', 'replace')
+
+    def login(self, username, password):
+        status, url, _ = self.request('/auth/login', {'username': username, 'password': password})
+        if status != 200 or urllib.parse.urlparse(url).path.startswith('/auth/login'):
+            raise RuntimeError(f'Login as {username!r} failed')
+
+
+def classify(status, body):
+    """Outcome of a request: ok, rate_limited, db_locked, app_error or http_<status>."""
+    if status == 429:
+        return 'rate_limited'
+    if status >= 400:
+        return f'http_{status}'
+    if any(message in body for message in LOCKED_MESSAGES):
+        return 'db_locked'
+    if ERROR_MESSAGE in body:
+        return 'app_error'
+    return 'ok'
+
+
+def op_index(session, dnr, rng):
+    return session.request('/')
+
+
+def op_view(session, dnr, rng):
+    return session.request(f'/case/{dnr}')
+
+
+def op_note(session, dnr, rng):
+    return session.request(f'/case/{dnr}/note', {
+        'ant_text': f'Lasttest {rng.randrange(10 ** 6)}',
+        'in_ut': rng.choice(['IN', 'UT', 'INTERN']),
+        'avsmot': 'Lasttest'
+    })
+
+
+def op_edit(session, dnr, rng):
+    # Load the form like a clerk would (not timed separately) and submit it unchanged
+    status, _, body = session.request(f'/case/{dnr}/edit')
+    if status != 200:
+        return status, '', body
+    parser = FormParser()
+    parser.feed(body)
+    fields = {name: value for name, value in parser.fields.items() if value is not None}
+    return session.request(f'/case/{dnr}/edit', fields)
+
+
+def op_api_case(session, dnr, rng):
+    return session.request(f'/api/case/{dnr}')
+
+
+def op_api_cases(session, dnr, rng):
+    return session.request('/api/cases?format=columnar')
+
+
+def op_api_queue(session, dnr, rng):
+    return session.request('/api/queue')
+
+
+OPERATIONS = {
+    'index': op_index,
+    'view': op_view,
+    'note': op_note,
+    'edit': op_edit,
+    'api_case': op_api_case,
+    'api_cases': op_api_cases,
+    'api_queue': op_api_queue,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}, expected one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def fetch_dnrs(session):
+    status, _, body = session.request('/api/cases?format=columnar')
+    if status != 200:
+        raise RuntimeError(f'Could not list cases through /api/cases (HTTP {status})')
+    cases = json.loads(body)['cases']
+    column = cases['columns'].index('DNR')
+    return [row[column] for row in cases['rows']]
+
+
+def read_server_metrics(base_url, timeout):
+    """Lock errors and write retries from /metrics, or None if not available."""
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + '/metrics', timeout=timeout) as response:
+            text = response.read().decode('utf-8')
+    except (urllib.error.URLError, OSError):
+        return None
+    values = {}
+    for name, pattern in [
+        ('locked', r'^db_errors_total\{kind="locked"\} (\S+)$'),
+        ('busy', r'^db_errors_total\{kind="busy"\} (\S+)$'),
+        ('write_retries', r'^db_write_retries_total (\S+)$'),
+    ]:
+        match = re.search(pattern, text, re.MULTILINE)
+        values[name] = float(match.group(1)) if match else 0.0
+    return values
+
+
+def run_worker(worker_id, args, mix, dnrs, deadline, results, lock):
+    rng = random.Random(args.seed + worker_id)
+    names, weights = list(mix), list(mix.values())
+    samples = []
+
+    session = Session(args.url, args.timeout)
+    session.login(args.username.format(i=worker_id), args.password)
+
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        dnr = rng.choice(dnrs)
+        start = time.perf_counter()
+        try:
+            status, _, body = OPERATIONS[name](session, dnr, rng)
+            outcome = classify(status, body)
+        except (urllib.error.URLError, OSError) as e:
+            outcome = 'network_error' if not isinstance(e, socket.timeout) else 'timeout'
+        samples.append((name, time.perf_counter() - start, outcome))
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+
+    with lock:
+        results.extend(samples)
+
+
+def summarize(samples, elapsed):
+    """Per-operation and total statistics; latencies in milliseconds."""
+    by_operation = {}
+    for name, latency, outcome in samples:
+        by_operation.setdefault(name, []).append((latency, outcome))
+    by_operation['total'] = [(latency, outcome) for _, latency, outcome in samples]
+
+    summary = {}
+    for name, entries in by_operation.items():
+        latencies = sorted(latency * 1000 for latency, _ in entries)
+        outcomes = {}
+        for _, outcome in entries:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        errors = len(entries) - outcomes.get('ok', 0)
+        summary[name] = {
+            'requests': len(entries),
+            'throughput': len(entries) / elapsed if elapsed else 0.0,
+            'error_rate': errors / len(entries) if entries else 0.0,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1] if latencies else 0.0,
+            'outcomes': outcomes,
+        }
+    return summary
+
+
+def print_summary(summary, elapsed, concurrency):
+    print(f"{concurrency} workers for {elapsed:.1f} s")
+    print(f"{'operation':<10} {'requests':>8} {'req/s':>8} {'errors':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  problems")
+    for name in sorted(summary, key=lambda n: (n == 'total', n)):
+        stats = summary[name]
+        problems = ', '.join(f'{outcome}={count}' for outcome, count in sorted(stats['outcomes'].items())
+                             if outcome != 'ok')
+        print(f"{name:<10} {stats['requests']:>8} {stats['throughput']:>8.1f} {stats['error_rate']:>7.1%} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}"
+              f"  {problems}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(env=None):
+    """Start the application in a child process; returns (process, base URL)."""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, '-c', SERVE_CHILD, str(port)], cwd=BASEDIR, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    if process.stdout.readline().strip() != 'ready':
+        process.kill()
+        raise RuntimeError('Server did not start')
+    return process, f'http://127.0.0.1:{port}'
+
+
+def copy_databases(target_dir):
+    """
+    Copy the configured database and archive into target_dir for --serve.
+
+    Returns the environment for the server. The SQLite backup API is used, so
+    the copies are consistent even while another process writes.
+    """
+    env = dict(os.environ)
+    for variable, source in (('DATABASE_PATH', Config.DATABASE_PATH),
+                             ('ARCHIVE_DATABASE_PATH', Config.ARCHIVE_DATABASE_PATH)):
+        target = os.path.join(target_dir, os.path.basename(source))
+        if os.path.exists(source):
+            src, dst = sqlite3.connect(source), sqlite3.connect(target)
+            try:
+                src.backup(dst)
+            finally:
+                src.close()
+                dst.close()
+        env[variable] = target
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive a mix of clerk and API traffic against the application.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL of the running instance')
+    parser.add_argument('--serve', action='store_true',
+                        help='Start the application on a free port, on a temporary copy of the database')
+    parser.add_argument('--username', default='admin',
+                        help='User to log in as; {i} is replaced by the worker number')
+    parser.add_argument('--password', required=True, help='Password of the user(s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Operation weights (default: {DEFAULT_MIX}); also available: api_queue')
+    parser.add_argument('--think-ms', type=float, default=0,
+                        help='Mean pause between a user\'s requests (exponentially distributed)')
+    parser.add_argument('--timeout', type=float, default=30, help='Request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the operation mix')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON to PATH')
+    parser.add_argument('--max-p95-ms', type=float, help='Exit with status 1 if the overall p95 exceeds this')
+    parser.add_argument('--max-error-rate', type=float,
+                        help='Exit with status 1 if the overall error rate exceeds this fraction')
+    args = parser.parse_args()
+
+    server, tmp = None, None
+    if args.serve:
+        tmp = tempfile.mkdtemp(prefix='loadtest-')
+        env = copy_databases(tmp)
+        usernames = sorted({args.username.format(i=i) for i in range(args.concurrency)})
+        if usernames != [args.username]:
+            subprocess.run([sys.executable, '-c', CREATE_USERS_CHILD, args.password, *usernames],
+                           cwd=BASEDIR, env=env, check=True)
+        server, args.url = start_server(env)
+
+    try:
+        setup = Session(args.url, args.timeout)
+        setup.login(args.username.format(i=0), args.password)
+        dnrs = fetch_dnrs(setup)
+        if not dnrs:
+            sys.exit('No cases in the database to run against')
+
+        metrics_before = read_server_metrics(args.url, args.timeout)
+
+        results, lock = [], threading.Lock()
+        start = time.monotonic()
+        deadline = start + args.duration
+        workers = [threading.Thread(target=run_worker, args=(i, args, args.mix, dnrs, deadline, results, lock))
+                   for i in range(args.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+
+        metrics_after = read_server_metrics(args.url, args.timeout)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    summary = summarize(results, elapsed)
+    print_summary(summary, elapsed, args.concurrency)
+
+    server_metrics = None
+    if metrics_before is not None and metrics_after is not None:
+        server_metrics = {name: metrics_after[name] - metrics_before[name] for name in metrics_after}
+        print(f"Server: {server_metrics['locked']:.0f} locked and {server_metrics['busy']:.0f} busy SQLite errors, "
+              f"{server_metrics['write_retries']:.0f} write retries")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'concurrency': args.concurrency, 'duration_s': elapsed, 'operations': summary,
+                       'server': server_metrics}, f, indent=2)
+
+    total = summary['total']
+    failed = False
+    if args.max_p95_ms is not None and total['p95_ms'] > args.max_p95_ms:
+        print(f"p95 {total['p95_ms']:.1f} ms exceeds {args.max_p95_ms:.1f} ms")
+        failed = True
+    if args.max_error_rate is not None and total['error_rate'] > args.max_error_rate:
+        print(f"Error rate {total['error_rate']:.2%} exceeds {args.max_error_rate:.2%}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
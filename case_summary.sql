@@ -0,0 +1,206 @@
+-- Denormalized case summary for list views.
+--
+-- AERENDE_LISTA holds one row per case with the display names from REG,
+-- HANDLAEGGARE, DOSSIEPLAN and ENHET already joined in, so list views read
+-- a single table instead of joining five. The triggers below keep it
+-- current for every write to AERENDE (web forms and the XML importer alike)
+-- and for inserts, renames and deletes in the dimension tables.
+--
+-- REV is set on every change to a summary row, so rendered list rows can
+-- be cached per (DNR, REV). It is taken from the one-row counter in
+-- AERENDE_LISTA_REV, which only ever grows, so a case that is deleted and
+-- created again (re-import, archiving) never gets a REV it had before.
+-- SENAST is the date of the latest LOG entry and drives the "recently
+-- touched" part of the work queue.
+--
+-- Every statement is idempotent; the file is applied to existing databases.
+
+CREATE TABLE IF NOT EXISTS AERENDE_LISTA (
+    DNR INTEGER PRIMARY KEY,
+    REG_ID TEXT,
+    IN_UT TEXT,
+    DOSS_NR INTEGER,
+    HAND_ID TEXT,
+    ENHT_KOD TEXT,
+    REGDAT DATE,
+    STAT TEXT,
+    ATEXT TEXT,
+    REG_NAMN TEXT,
+    HAND_NAMN TEXT,
+    DOSS_NAMN TEXT,
+    ENHT_NAMN TEXT,
+    REV INTEGER NOT NULL DEFAULT 1,
+    SENAST DATE
+);
+
+CREATE TABLE IF NOT EXISTS AERENDE_LISTA_REV (
+    REV INTEGER NOT NULL
+);
+
+INSERT INTO AERENDE_LISTA_REV (REV)
+SELECT IFNULL(MAX(REV), 0) FROM AERENDE_LISTA
+WHERE NOT EXISTS (SELECT 1 FROM AERENDE_LISTA_REV);
+
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_REGDAT ON AERENDE_LISTA (REGDAT DESC);
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_REG_ID ON AERENDE_LISTA (REG_ID);
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_HAND_ID ON AERENDE_LISTA (HAND_ID);
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_DOSS_NR ON AERENDE_LISTA (DOSS_NR);
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_ENHT_KOD ON AERENDE_LISTA (ENHT_KOD);
+
+-- Work queue: a handler's open cases, and the cases they touched last
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_OPPNA ON AERENDE_LISTA (HAND_ID, REGDAT DESC)
+    WHERE STAT IS NOT 'Avslutad';
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_OPPNA_STAT ON AERENDE_LISTA (HAND_ID, STAT)
+    WHERE STAT IS NOT 'Avslutad';
+CREATE INDEX IF NOT EXISTS IDX_AERENDE_LISTA_SENAST ON AERENDE_LISTA (HAND_ID, SENAST DESC);
+
+-- Latest log date per case, used by the triggers below
+CREATE INDEX IF NOT EXISTS IDX_LOG_DNR_LOGDAT ON LOG (DNR, LOGDAT);
+
+
+-- Case writes
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_AERENDE_INSERT AFTER INSERT ON AERENDE
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    INSERT OR REPLACE INTO AERENDE_LISTA (
+        DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD, REGDAT, STAT, ATEXT,
+        REG_NAMN, HAND_NAMN, DOSS_NAMN, ENHT_NAMN, REV, SENAST
+    )
+    SELECT a.DNR, a.REG_ID, a.IN_UT, a.DOSS_NR, a.HAND_ID, a.ENHT_KOD, a.REGDAT, a.STAT, a.ATEXT,
+           r.REG_NAMN, h.HAND_NAMN, d.NAMN, e.ENHT_NAMN,
+           (SELECT REV FROM AERENDE_LISTA_REV),
+           (SELECT MAX(LOGDAT) FROM LOG WHERE DNR = NEW.DNR)
+    FROM AERENDE a
+    LEFT JOIN REG r ON a.REG_ID = r.REG_ID
+    LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
+    LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
+    LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
+    WHERE a.DNR = NEW.DNR;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_AERENDE_UPDATE AFTER UPDATE ON AERENDE
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    DELETE FROM AERENDE_LISTA WHERE DNR = OLD.DNR AND OLD.DNR IS NOT NEW.DNR;
+    INSERT OR REPLACE INTO AERENDE_LISTA (
+        DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD, REGDAT, STAT, ATEXT,
+        REG_NAMN, HAND_NAMN, DOSS_NAMN, ENHT_NAMN, REV, SENAST
+    )
+    SELECT a.DNR, a.REG_ID, a.IN_UT, a.DOSS_NR, a.HAND_ID, a.ENHT_KOD, a.REGDAT, a.STAT, a.ATEXT,
+           r.REG_NAMN, h.HAND_NAMN, d.NAMN, e.ENHT_NAMN,
+           (SELECT REV FROM AERENDE_LISTA_REV),
+           (SELECT MAX(LOGDAT) FROM LOG WHERE DNR = NEW.DNR)
+    FROM AERENDE a
+    LEFT JOIN REG r ON a.REG_ID = r.REG_ID
+    LEFT JOIN HANDLAEGGARE h ON a.HAND_ID = h.HAND_ID
+    LEFT JOIN DOSSIEPLAN d ON a.DOSS_NR = d.DOSS_NR
+    LEFT JOIN ENHET e ON a.ENHT_KOD = e.ENHT_KOD
+    WHERE a.DNR = NEW.DNR;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_AERENDE_DELETE AFTER DELETE ON AERENDE
+BEGIN
+    DELETE FROM AERENDE_LISTA WHERE DNR = OLD.DNR;
+END;
+
+
+
+-- Log writes (SENAST only; the list rows do not show it, so REV is kept)
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_LOG_INSERT AFTER INSERT ON LOG
+BEGIN
+    UPDATE AERENDE_LISTA SET SENAST = NEW.LOGDAT
+    WHERE DNR = NEW.DNR AND (SENAST IS NULL OR SENAST < NEW.LOGDAT);
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_LOG_UPDATE AFTER UPDATE OF DNR, LOGDAT ON LOG
+BEGIN
+    UPDATE AERENDE_LISTA SET SENAST = (SELECT MAX(LOGDAT) FROM LOG WHERE DNR = AERENDE_LISTA.DNR)
+    WHERE DNR IN (OLD.DNR, NEW.DNR);
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_LOG_DELETE AFTER DELETE ON LOG
+BEGIN
+    UPDATE AERENDE_LISTA SET SENAST = (SELECT MAX(LOGDAT) FROM LOG WHERE DNR = OLD.DNR)
+    WHERE DNR = OLD.DNR;
+END;
+
+
+-- Dimension writes
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_REG_INSERT AFTER INSERT ON REG
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET REG_NAMN = NEW.REG_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE REG_ID = NEW.REG_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_REG_UPDATE AFTER UPDATE OF REG_ID, REG_NAMN ON REG
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET REG_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE REG_ID = OLD.REG_ID AND OLD.REG_ID IS NOT NEW.REG_ID;
+    UPDATE AERENDE_LISTA SET REG_NAMN = NEW.REG_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE REG_ID = NEW.REG_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_REG_DELETE AFTER DELETE ON REG
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET REG_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE REG_ID = OLD.REG_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_HANDLAEGGARE_INSERT AFTER INSERT ON HANDLAEGGARE
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET HAND_NAMN = NEW.HAND_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE HAND_ID = NEW.HAND_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_HANDLAEGGARE_UPDATE AFTER UPDATE OF HAND_ID, HAND_NAMN ON HANDLAEGGARE
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET HAND_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE HAND_ID = OLD.HAND_ID AND OLD.HAND_ID IS NOT NEW.HAND_ID;
+    UPDATE AERENDE_LISTA SET HAND_NAMN = NEW.HAND_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE HAND_ID = NEW.HAND_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_HANDLAEGGARE_DELETE AFTER DELETE ON HANDLAEGGARE
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET HAND_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE HAND_ID = OLD.HAND_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_DOSSIEPLAN_INSERT AFTER INSERT ON DOSSIEPLAN
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET DOSS_NAMN = NEW.NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE DOSS_NR = NEW.DOSS_NR;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_DOSSIEPLAN_UPDATE AFTER UPDATE OF DOSS_NR, NAMN ON DOSSIEPLAN
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET DOSS_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE DOSS_NR = OLD.DOSS_NR AND OLD.DOSS_NR IS NOT NEW.DOSS_NR;
+    UPDATE AERENDE_LISTA SET DOSS_NAMN = NEW.NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE DOSS_NR = NEW.DOSS_NR;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_DOSSIEPLAN_DELETE AFTER DELETE ON DOSSIEPLAN
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET DOSS_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE DOSS_NR = OLD.DOSS_NR;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_ENHET_INSERT AFTER INSERT ON ENHET
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET ENHT_NAMN = NEW.ENHT_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE ENHT_KOD = NEW.ENHT_KOD;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_ENHET_UPDATE AFTER UPDATE OF ENHT_KOD, ENHT_NAMN ON ENHET
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET ENHT_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE ENHT_KOD = OLD.ENHT_KOD AND OLD.ENHT_KOD IS NOT NEW.ENHT_KOD;
+    UPDATE AERENDE_LISTA SET ENHT_NAMN = NEW.ENHT_NAMN, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE ENHT_KOD = NEW.ENHT_KOD;
+END;
+
+CREATE TRIGGER IF NOT EXISTS AERENDE_LISTA_ENHET_DELETE AFTER DELETE ON ENHET
+BEGIN
+    UPDATE AERENDE_LISTA_REV SET REV = REV + 1;
+    UPDATE AERENDE_LISTA SET ENHT_NAMN = NULL, REV = (SELECT REV FROM AERENDE_LISTA_REV) WHERE ENHT_KOD = OLD.ENHT_KOD;
+END;
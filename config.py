@@ -7,6 +7,59 @@ class Config:
 
     # Database configuration
     BASEDIR = os.path.abspath(os.path.dirname(__file__))
-    DATABASE_PATH = os.path.join(BASEDIR, 'case_management.db')
+    DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(BASEDIR, 'case_management.db'))
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Seconds a connection waits for another connection's lock before failing
+    # with "database is locked"; locked write transactions are then retried
+    # up to SQLITE_WRITE_RETRIES times after a jittered delay (see app/utils/db.py).
+    # SQLITE_SERIALIZE_WRITES makes the threads of one process write one at a time.
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+    SQLITE_WRITE_RETRIES = int(os.environ.get('SQLITE_WRITE_RETRIES', 3))
+    SQLITE_RETRY_DELAY = float(os.environ.get('SQLITE_RETRY_DELAY', 0.05))
+    SQLITE_SERIALIZE_WRITES = os.environ.get('SQLITE_SERIALIZE_WRITES', '0') == '1'
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT}}
+
+    # Journal mode set on startup; in WAL mode readers and the writer do not block each other
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'wal')
+
+    # Closed cases moved out by archive_cases.py; attached to request connections as schema "arkiv"
+    ARCHIVE_DATABASE_PATH = os.environ.get('ARCHIVE_DATABASE_PATH', os.path.join(BASEDIR, 'case_archive.db'))
+
+    # Number of rendered case list rows kept in memory per process
+    CASE_ROW_CACHE_SIZE = int(os.environ.get('CASE_ROW_CACHE_SIZE', 10000))
+
+    # Notes and log entries shown per page on the case page and by /api/case/<dnr>/timeline
+    TIMELINE_PAGE_SIZE = int(os.environ.get('TIMELINE_PAGE_SIZE', 50))
+
+    # Maximum number of open cases shown in a handler's work queue
+    WORK_QUEUE_LIMIT = int(os.environ.get('WORK_QUEUE_LIMIT', 200))
+
+    # API rate limiting: requests per second and burst size per user, or per
+    # client address for anonymous requests (0 disables), and how many
+    # expensive API requests may run at once per process. The API_UI_* limits
+    # apply instead to the typeahead and timeline calls made by the web pages.
+    # Set RATELIMIT_REDIS_URL to share the limits between processes (requires
+    # the redis package).
+    API_RATE_LIMIT = float(os.environ.get('API_RATE_LIMIT', 5))
+    API_RATE_BURST = int(os.environ.get('API_RATE_BURST', 20))
+    API_UI_RATE_LIMIT = float(os.environ.get('API_UI_RATE_LIMIT', 20))
+    API_UI_RATE_BURST = int(os.environ.get('API_UI_RATE_BURST', 60))
+    API_MAX_CONCURRENT = int(os.environ.get('API_MAX_CONCURRENT', 2))
+    API_CONCURRENCY_WAIT = float(os.environ.get('API_CONCURRENCY_WAIT', 0.5))
+    RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL')
+
+    # Client addresses that may read /metrics without logging in (comma separated)
+    METRICS_ALLOWED_ADDRESSES = tuple(
+        address.strip() for address in os.environ.get('METRICS_ALLOWED_ADDRESSES', '127.0.0.1,::1').split(',')
+    )
+
+    # Password hashing: werkzeug method and cost for new hashes, e.g. "scrypt:16384:8:1"
+    # or "pbkdf2:sha256:600000". Stored hashes made with other parameters are replaced at
+    # the next successful login. Hashes are computed on PASSWORD_HASH_WORKERS threads per
+    # process (default half the CPUs); logins beyond PASSWORD_HASH_QUEUE waiting ones are
+    # asked to try again (see app/utils/passwords.py).
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Export cases with their notes and logs to a ZIP archive.
+
+Each case is written as one XML document in the format read by import_xml.py
+(or as JSON with --format json). The archive is written incrementally, so
+exports of any size need little memory.
+Usage: python export_cases.py -o export.zip [--doss-nr 3] [--enht-kod E1] [--from 2020-01-01] [--to 2020-12-31]
+"""
+
+import argparse
+import sqlite3
+import sys
+
+from config import Config
+from app.utils.archive import attach_archive
+from app.utils.export import EXPORT_FORMATS, parse_filters, stream_export
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export cases with notes and logs to a ZIP archive.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='ZIP file to write, or - for standard output')
+    parser.add_argument('--doss-nr', help='Only cases in this dossier (DOSS_NR)')
+    parser.add_argument('--enht-kod', help='Only cases belonging to this unit (ENHT_KOD)')
+    parser.add_argument('--from', dest='date_from', help='Only cases registered on or after this date, YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', help='Only cases registered on or before this date, YYYY-MM-DD')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='xml',
+                        help='Document format inside the archive (default: xml)')
+    parser.add_argument('--include-archived', action='store_true',
+                        help='Also export cases moved to the archive database')
+    parser.add_argument('--db', default=Config.DATABASE_PATH,
+                        help='Path to the SQLite database')
+    parser.add_argument('--archive', default=Config.ARCHIVE_DATABASE_PATH,
+                        help='Path to the archive SQLite database')
+    args = parser.parse_args()
+
+    try:
+        filters = parse_filters(args.doss_nr, args.enht_kod, args.date_from, args.date_to)
+    except ValueError as e:
+        parser.error(f"invalid filter: {e}")
+
+    conn = sqlite3.connect(args.db, timeout=Config.SQLITE_BUSY_TIMEOUT)
+    if args.include_archived:
+        attach_archive(conn, args.archive)
+
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    size = 0
+    try:
+        for chunk in stream_export(conn, filters, args.format, args.include_archived):
+            output.write(chunk)
+            size += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        conn.close()
+
+    print(f"Wrote {size} bytes to {args.output}.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,22 +3,48 @@
 XML Case Importer for Case Management System
 
 This script imports case data from XML files into the case management database.
-Usage: python import_xml.py <file1.xml> [file2.xml] [file3.xml] ...
+Usage: python import_xml.py <file1.xml|directory> [file2.xml] [file3.xml] ...
+
+With --merge, cases that already exist are updated in place: only changed
+columns, notes and logs are written.
+
+With --dry-run nothing is imported; instead every file is validated in
+parallel and the problems found are written to a JSONL report.
+
+With --metrics-file the import counters, per-case timings and throughput
+are written in Prometheus text format, e.g. for a textfile collector.
 """
 
 import sys
 import os
 import argparse
+import json
 import xml.etree.ElementTree as ET
 import sqlite3
 import datetime
+import time
+from collections import Counter
+from multiprocessing import Pool
 from typing import List, Dict, Any, Optional
 
+from app.utils import metrics
+from app.utils.archive import ARCHIVE_SCHEMA, attach_archive, find_case_schema
+from app.utils.codes import DIRECTION_MAP, STATUS_MAP, log_text
+from app.utils.names import TableNameIndex
+
+
+# Seconds to wait for the web application's write lock before a case fails
+BUSY_TIMEOUT = 30
+
+# Closed cases moved out by archive_cases.py; imported cases must not exist there
+ARCHIVE_PATH = 'case_archive.db'
+
 
 def get_db_connection() -> sqlite3.Connection:
-    """Connect to the SQLite database."""
-    conn = sqlite3.connect('case_management.db')
+    """Connect to the SQLite database, with the archive attached if there is one."""
+    conn = sqlite3.connect('case_management.db', timeout=BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row
+    attach_archive(conn, ARCHIVE_PATH)
     return conn
 
 
@@ -37,114 +63,113 @@ def parse_xml_file(file_path: str) -> Dict[str, Any]:
         root = tree.getroot()
 
         # Find the first AErende (case) element
-        ns = {'xsi': 'http://www.w3.org/2001/XMLSchema-instance'}
         case_element = root.find('.//AErende')
 
         if case_element is None:
             print(f"No case found in {file_path}")
             return {}
 
-        # Extract case data
-        case_data = {
-            'dnr': int(case_element.findtext('Diarienummer', '0')),
-            'in_ut': map_direction(case_element.findtext('Riktning', '')),
-            'atext': case_element.findtext('AErendemening', ''),
-            'stat': map_status(case_element.findtext('Status', '')),
-            'inkupp': parse_date(case_element.findtext('Inkomst_uppraettat_datum', '')),
-            'regdat': parse_date(case_element.findtext('Registreringsdatum', '')),
-            'avsdat': parse_date(case_element.findtext('Avslutsdatum', '')),
-            'motpart_bet': case_element.findtext('Motpartens_beteckning', ''),
-            'fran_till': case_element.findtext('Fraan_till', ''),
-
-            # These will need lookup or creation
+        return extract_case(case_element)
+
+    except Exception as e:
+        print(f"Error parsing {file_path}: {str(e)}")
+        return {}
+
+
+def extract_case(case_element: ET.Element) -> Dict[str, Any]:
+    """
+    Extract case, notes and logs from an AErende element.
+
+    Raises ValueError if numeric fields cannot be converted.
+    """
+    # Extract case data
+    case_data = {
+        'dnr': int(case_element.findtext('Diarienummer', '0')),
+        'in_ut': map_direction(case_element.findtext('Riktning', '')),
+        'atext': case_element.findtext('AErendemening', ''),
+        'stat': map_status(case_element.findtext('Status', '')),
+        'inkupp': parse_date(case_element.findtext('Inkomst_uppraettat_datum', '')),
+        'regdat': parse_date(case_element.findtext('Registreringsdatum', '')),
+        'avsdat': parse_date(case_element.findtext('Avslutsdatum', '')),
+        'motpart_bet': case_element.findtext('Motpartens_beteckning', ''),
+        'fran_till': case_element.findtext('Fraan_till', ''),
+
+        # These will need lookup or creation
+        'reg_id': None,  # Will be set based on registrator
+        'doss_nr': None,  # Will be extracted from Diarieplan/Dossiernummer
+        'hand_id': None,  # Will be set based on handlaeggare name
+        'enht_kod': None,  # Will be set based on Enhet ID
+
+        # Additional data for lookups
+        'registrator': case_element.findtext('Registrator', ''),
+        'handlaeggare': case_element.findtext('Handlaeggare', ''),
+        'enhet_name': None,
+        'dossier_name': None,
+    }
+
+    # Extract dossier information
+    diarieplan = case_element.find('Diarieplan')
+    if diarieplan is not None:
+        case_data['doss_nr'] = int(diarieplan.findtext('Dossiernummer', '0'))
+        case_data['dossier_name'] = diarieplan.findtext('Rubrik', '')
+
+    # Extract unit information
+    enhet = case_element.find('Enhet')
+    if enhet is not None:
+        case_data['enht_kod'] = enhet.get('ID', '')
+        case_data['enhet_name'] = enhet.text
+
+    # Extract notes (händelser)
+    notes = []
+    for idx, haendelse in enumerate(case_element.findall('.//Haendelse')):
+        note = {
+            'dnr': case_data['dnr'],
+            'lnr': int(haendelse.findtext('Loepnummer', str(idx + 1))),
+            'in_ut': map_direction(haendelse.findtext('Riktning', '')),
+            'ant_text': haendelse.findtext('Haendelsetext', ''),
             'reg_id': None,  # Will be set based on registrator
-            'doss_nr': None,  # Will be extracted from Diarieplan/Dossiernummer
-            'hand_id': None,  # Will be set based on handlaeggare name
-            'enht_kod': None,  # Will be set based on Enhet ID
+            'datumin': parse_date(haendelse.findtext('Inkommandedatum', '')),
+            'datumut': parse_date(haendelse.findtext('Utgaaendedatum', '')),
+            'anmkal': '',  # Not in XML
+            'hand_id': None,  # Will be set based on handlaeggare
+            'avsmot': haendelse.findtext('Motpart', ''),
 
             # Additional data for lookups
-            'registrator': case_element.findtext('Registrator', ''),
-            'handlaeggare': case_element.findtext('Handlaeggare', ''),
-            'enhet_name': None,
-            'dossier_name': None,
+            'registrator': haendelse.findtext('Registrator', ''),
+            'handlaeggare': haendelse.findtext('Handlaeggare', ''),
         }
+        notes.append(note)
+
+    # Extract logs
+    logs = []
+    for logg in case_element.findall('.//Logg'):
+        log = {
+            'dnr': case_data['dnr'],
+            'reg_id': None,  # Will be set based on registrator
+            'logdat': parse_datetime(logg.findtext('AEndringsdatum', '')),
+            # Loggtext holds texts that do not name a field (see app/utils/codes.py)
+            'logflt': logg.findtext('Loggtext') or log_text(logg.findtext('Faeltnamn', '')),
 
-        # Extract dossier information
-        diarieplan = case_element.find('Diarieplan')
-        if diarieplan is not None:
-            case_data['doss_nr'] = int(diarieplan.findtext('Dossiernummer', '0'))
-            case_data['dossier_name'] = diarieplan.findtext('Rubrik', '')
-
-        # Extract unit information
-        enhet = case_element.find('Enhet')
-        if enhet is not None:
-            case_data['enht_kod'] = enhet.get('ID', '')
-            case_data['enhet_name'] = enhet.text
-
-        # Extract notes (händelser)
-        notes = []
-        for idx, haendelse in enumerate(case_element.findall('.//Haendelse')):
-            note = {
-                'dnr': case_data['dnr'],
-                'lnr': int(haendelse.findtext('Loepnummer', str(idx + 1))),
-                'in_ut': map_direction(haendelse.findtext('Riktning', '')),
-                'ant_text': haendelse.findtext('Haendelsetext', ''),
-                'reg_id': None,  # Will be set based on registrator
-                'datumin': parse_date(haendelse.findtext('Inkommandedatum', '')),
-                'datumut': parse_date(haendelse.findtext('Utgaaendedatum', '')),
-                'anmkal': '',  # Not in XML
-                'hand_id': None,  # Will be set based on handlaeggare
-                'avsmot': haendelse.findtext('Motpart', ''),
-
-                # Additional data for lookups
-                'registrator': haendelse.findtext('Registrator', ''),
-                'handlaeggare': haendelse.findtext('Handlaeggare', ''),
-            }
-            notes.append(note)
-
-        # Extract logs
-        logs = []
-        for logg in case_element.findall('.//Logg'):
-            log = {
-                'dnr': case_data['dnr'],
-                'reg_id': None,  # Will be set based on registrator
-                'logdat': parse_datetime(logg.findtext('AEndringsdatum', '')),
-                'logflt': f"Ändring av {logg.findtext('Faeltnamn', '')}",
-
-                # Additional data for lookups
-                'registrator': logg.findtext('Registrator', ''),
-            }
-            logs.append(log)
-
-        return {
-            'case': case_data,
-            'notes': notes,
-            'logs': logs
+            # Additional data for lookups
+            'registrator': logg.findtext('Registrator', ''),
         }
+        logs.append(log)
 
-    except Exception as e:
-        print(f"Error parsing {file_path}: {str(e)}")
-        return {}
+    return {
+        'case': case_data,
+        'notes': notes,
+        'logs': logs
+    }
 
 
 def map_direction(direction: str) -> str:
     """Map XML direction values to database values."""
-    direction_map = {
-        'I': 'IN',
-        'U': 'UT',
-        '': 'INTERN'
-    }
-    return direction_map.get(direction, 'INTERN')
+    return DIRECTION_MAP.get(direction, 'INTERN')
 
 
 def map_status(status: str) -> str:
     """Map XML status values to database values."""
-    status_map = {
-        'Ö': 'Pågående',
-        'A': 'Avslutad',
-        '': 'Ny'
-    }
-    return status_map.get(status, 'Ny')
+    return STATUS_MAP.get(status, 'Ny')
 
 
 def parse_date(date_str: str) -> Optional[str]:
@@ -161,15 +186,31 @@ def parse_date(date_str: str) -> Optional[str]:
 
 
 def parse_datetime(datetime_str: str) -> Optional[str]:
-    """Parse datetime string to date format YYYY-MM-DD."""
+    """
+    Parse a YYYY-MM-DDThh:mm:ss timestamp to the database format YYYY-MM-DD HH:MM:SS.
+
+    The time is kept because LOG is keyed on (DNR, REG_ID, LOGDAT): with only
+    the date, a registrator's changes on the same day would share one key.
+    Dates without a time, and values that cannot be parsed, are kept as they are.
+    """
     if not datetime_str:
         return None
 
     try:
-        # Extract just the date part from YYYY-MM-DDThh:mm:ss
-        return datetime_str.split('T')[0]
-    except:
-        return None
+        parsed = datetime.datetime.fromisoformat(datetime_str)
+    except ValueError:
+        return datetime_str
+    if len(datetime_str) <= len('YYYY-MM-DD'):
+        return datetime_str
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Name indexes used to resolve registrators and handlers (see app/utils/names.py)
+REGISTRY_NAMES = TableNameIndex('REG', 'REG_ID', 'REG_NAMN')
+HANDLER_NAMES = TableNameIndex('HANDLAEGGARE', 'HAND_ID', 'HAND_NAMN')
+
+# Trigram similarity needed to reuse an existing name written differently
+NAME_MATCH_THRESHOLD = 0.8
 
 
 def get_or_create_registry(conn: sqlite3.Connection, registrator: str) -> str:
@@ -177,11 +218,10 @@ def get_or_create_registry(conn: sqlite3.Connection, registrator: str) -> str:
     cur = conn.cursor()
 
     # Check if we have a registry for this registrator
-    cur.execute("SELECT REG_ID FROM REG WHERE REG_NAMN LIKE ?", (f"%{registrator}%",))
-    result = cur.fetchone()
+    result = REGISTRY_NAMES.get(conn).resolve(registrator, NAME_MATCH_THRESHOLD)
 
     if result:
-        return result[0]
+        return result
 
     # Create a new registry
     reg_id = f"R{str(registrator).upper()[0:3]}"
@@ -203,6 +243,7 @@ def get_or_create_registry(conn: sqlite3.Connection, registrator: str) -> str:
     cur.execute("INSERT INTO REG (REG_ID, REG_NAMN) VALUES (?, ?)",
                 (reg_id, f"{registrator}"))
     conn.commit()
+    REGISTRY_NAMES.added(conn, reg_id, f"{registrator}")
 
     return reg_id
 
@@ -234,13 +275,11 @@ def get_or_create_handler(conn: sqlite3.Connection, handler_name: str) -> Option
 
     cur = conn.cursor()
 
-    # Check if handler exists (exact match or similar)
-    cur.execute("SELECT HAND_ID FROM HANDLAEGGARE WHERE HAND_NAMN = ? OR HAND_NAMN LIKE ?",
-                (handler_name, f"%{handler_name}%"))
-    result = cur.fetchone()
+    # Check if handler exists (same normalized name or a very similar one)
+    result = HANDLER_NAMES.get(conn).resolve(handler_name, NAME_MATCH_THRESHOLD)
 
     if result:
-        return result[0]
+        return result
 
     # Create a new handler
     hand_id = f"H{len(handler_name.split()[-1])}{len(handler_name.split()[0])}"
@@ -262,6 +301,7 @@ def get_or_create_handler(conn: sqlite3.Connection, handler_name: str) -> Option
     cur.execute("INSERT INTO HANDLAEGGARE (HAND_ID, HAND_NAMN) VALUES (?, ?)",
                 (hand_id, handler_name))
     conn.commit()
+    HANDLER_NAMES.added(conn, hand_id, handler_name)
 
     return hand_id
 
@@ -286,8 +326,74 @@ def get_or_create_unit(conn: sqlite3.Connection, unit_code: str, unit_name: Opti
     return unit_code
 
 
-def import_case(conn: sqlite3.Connection, case_data: Dict[str, Any]) -> bool:
-    """Import a case into the database."""
+# AERENDE columns written by the importer and their keys in the parsed case
+CASE_COLUMNS = [
+    ('REG_ID', 'reg_id'), ('IN_UT', 'in_ut'), ('DOSS_NR', 'doss_nr'),
+    ('HAND_ID', 'hand_id'), ('ENHT_KOD', 'enht_kod'), ('INKUPP', 'inkupp'),
+    ('REGDAT', 'regdat'), ('AVSDAT', 'avsdat'), ('STAT', 'stat'),
+    ('ATEXT', 'atext'), ('MOTPART_BET', 'motpart_bet'), ('FRAN_TILL', 'fran_till'),
+]
+
+# Merge mode: insert new notes and logs, update changed ones, leave identical rows untouched
+NOTE_UPSERT = """
+    INSERT INTO AERENDE_ANT (
+        DNR, LNR, IN_UT, ANT_TEXT, REG_ID,
+        DATUMIN, DATUMUT, ANMKAL, HAND_ID, AVSMOT
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (DNR, LNR) DO UPDATE SET
+        IN_UT = excluded.IN_UT, ANT_TEXT = excluded.ANT_TEXT, REG_ID = excluded.REG_ID,
+        DATUMIN = excluded.DATUMIN, DATUMUT = excluded.DATUMUT, ANMKAL = excluded.ANMKAL,
+        HAND_ID = excluded.HAND_ID, AVSMOT = excluded.AVSMOT
+    WHERE IN_UT IS NOT excluded.IN_UT OR ANT_TEXT IS NOT excluded.ANT_TEXT
+        OR REG_ID IS NOT excluded.REG_ID OR DATUMIN IS NOT excluded.DATUMIN
+        OR DATUMUT IS NOT excluded.DATUMUT OR ANMKAL IS NOT excluded.ANMKAL
+        OR HAND_ID IS NOT excluded.HAND_ID OR AVSMOT IS NOT excluded.AVSMOT
+"""
+
+LOG_UPSERT = """
+    INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (DNR, REG_ID, LOGDAT) DO UPDATE SET LOGFLT = excluded.LOGFLT
+    WHERE LOGFLT IS NOT excluded.LOGFLT
+"""
+
+# Merge mode: earlier imports stored only the date of a log and the case's
+# registrator; move such a row to the log's full key instead of adding a copy
+LOG_REKEY = """
+    UPDATE LOG SET REG_ID = ?, LOGDAT = ?
+    WHERE rowid = (SELECT rowid FROM LOG WHERE DNR = ? AND LOGDAT = ? AND LOGFLT IS ? LIMIT 1)
+        AND NOT EXISTS (SELECT 1 FROM LOG WHERE DNR = ? AND REG_ID = ? AND LOGDAT = ?)
+"""
+
+
+def duplicate_log_keys(keys: List[tuple]) -> List[tuple]:
+    """The LOG keys (e.g. registrator and date) that occur more than once, with their counts."""
+    return [(*key, count) for key, count in Counter(keys).items() if count > 1]
+
+
+def merge_case_row(cur: sqlite3.Cursor, case: Dict[str, Any]) -> List[str]:
+    """Update only the AERENDE columns that differ from the stored case. Returns the changed columns."""
+    columns = [column for column, _ in CASE_COLUMNS]
+    cur.execute(f"SELECT {', '.join(columns)} FROM AERENDE WHERE DNR = ?", (case['dnr'],))
+    stored = dict(zip(columns, cur.fetchone()))
+
+    changed = [column for column, key in CASE_COLUMNS if stored[column] != case[key]]
+    if changed:
+        assignments = ', '.join(f"{column} = ?" for column in changed)
+        values = [case[key] for column, key in CASE_COLUMNS if column in changed]
+        cur.execute(f"UPDATE AERENDE SET {assignments} WHERE DNR = ?", (*values, case['dnr']))
+    return changed
+
+
+def import_case(conn: sqlite3.Connection, case_data: Dict[str, Any], merge: bool = False) -> bool:
+    """
+    Import a case into the database.
+
+    With merge=True a case that already exists is updated instead of
+    rejected: only changed case columns are written, and notes and logs are
+    upserted so that unchanged rows are left alone. Cases in the archive
+    database are always rejected.
+    """
     # Extract data
     case = case_data.get('case', {})
     notes = case_data.get('notes', [])
@@ -311,109 +417,367 @@ def import_case(conn: sqlite3.Connection, case_data: Dict[str, Any]) -> bool:
         case['hand_id'] = hand_id
         case['enht_kod'] = enht_kod
 
-        # Check if case already exists
-        cur.execute("SELECT COUNT(*) FROM AERENDE WHERE DNR = ?", (case['dnr'],))
-        case_exists = cur.fetchone()[0] > 0
+        # A log without a date has LOGDAT NULL, which never matches the LOG key,
+        # so every merge would insert it again; such a case is rejected
+        undated = sum(1 for log in logs if not log['logdat'])
+        if undated:
+            raise ValueError(f'{undated} logs without AEndringsdatum')
 
-        if case_exists:
+        # Each log belongs to its own registrator. Logs sharing a key would
+        # overwrite each other, so such a case is rejected before it is written
+        for log in logs:
+            log['reg_id'] = get_or_create_registry(conn, log['registrator']) if log['registrator'] else reg_id
+        duplicates = duplicate_log_keys([(log['reg_id'], log['logdat']) for log in logs])
+        if duplicates:
+            raise ValueError('logs with the same registrator and time: ' + ', '.join(
+                f"{log_reg_id} {logdat} ({count} times)" for log_reg_id, logdat, count in duplicates))
+
+        # Check if case already exists. Archived cases are read-only, so they
+        # are never replaced or merged into
+        schema = find_case_schema(conn, case['dnr'])
+        if schema == ARCHIVE_SCHEMA:
+            print(f"Case {case['dnr']} is in the archive database and cannot be imported again.")
+            return False
+        case_exists = schema is not None
+
+        if case_exists and not merge:
             print(f"Case {case['dnr']} already exists in the database.")
             return False
 
-        # Insert case
-        cur.execute("""
-            INSERT INTO AERENDE (
-                DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD,
-                INKUPP, REGDAT, AVSDAT, STAT, ATEXT,
-                MOTPART_BET, FRAN_TILL
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            case['dnr'], case['reg_id'], case['in_ut'], case['doss_nr'],
-            case['hand_id'], case['enht_kod'], case['inkupp'], case['regdat'],
-            case['avsdat'], case['stat'], case['atext'],
-            case['motpart_bet'], case['fran_till']
-        ))
+        if case_exists:
+            changed_columns = merge_case_row(cur, case)
+        else:
+            # Insert case
+            cur.execute("""
+                INSERT INTO AERENDE (
+                    DNR, REG_ID, IN_UT, DOSS_NR, HAND_ID, ENHT_KOD,
+                    INKUPP, REGDAT, AVSDAT, STAT, ATEXT,
+                    MOTPART_BET, FRAN_TILL
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                case['dnr'], case['reg_id'], case['in_ut'], case['doss_nr'],
+                case['hand_id'], case['enht_kod'], case['inkupp'], case['regdat'],
+                case['avsdat'], case['stat'], case['atext'],
+                case['motpart_bet'], case['fran_till']
+            ))
+
+        note_sql = NOTE_UPSERT if merge else """
+            INSERT INTO AERENDE_ANT (
+                DNR, LNR, IN_UT, ANT_TEXT, REG_ID,
+                DATUMIN, DATUMUT, ANMKAL, HAND_ID, AVSMOT
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        log_sql = LOG_UPSERT if merge else """
+            INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
+            VALUES (?, ?, ?, ?)
+        """
 
         # Import notes
+        notes_written = 0
         for note in notes:
             note['reg_id'] = reg_id
             note['hand_id'] = get_or_create_handler(conn, note.get('handlaeggare')) or hand_id
 
-            cur.execute("""
-                INSERT INTO AERENDE_ANT (
-                    DNR, LNR, IN_UT, ANT_TEXT, REG_ID,
-                    DATUMIN, DATUMUT, ANMKAL, HAND_ID, AVSMOT
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            cur.execute(note_sql, (
                 note['dnr'], note['lnr'], note['in_ut'], note['ant_text'],
                 note['reg_id'], note['datumin'], note['datumut'],
                 note.get('anmkal', ''), note['hand_id'], note.get('avsmot', '')
             ))
+            notes_written += cur.rowcount
 
         # Import logs
+        logs_written = 0
         for log in logs:
-            log['reg_id'] = reg_id
-
-            cur.execute("""
-                INSERT INTO LOG (DNR, REG_ID, LOGDAT, LOGFLT)
-                VALUES (?, ?, ?, ?)
-            """, (
+            if merge and log['logdat'] and len(log['logdat']) > len('YYYY-MM-DD'):
+                cur.execute(LOG_REKEY, (
+                    log['reg_id'], log['logdat'], log['dnr'], log['logdat'][:len('YYYY-MM-DD')],
+                    log['logflt'], log['dnr'], log['reg_id'], log['logdat']
+                ))
+                logs_written += cur.rowcount
+
+            cur.execute(log_sql, (
                 log['dnr'], log['reg_id'], log['logdat'], log['logflt']
             ))
+            logs_written += cur.rowcount
 
         conn.commit()
+
+        if case_exists:
+            print(f"Case {case['dnr']} merged: {len(changed_columns)} changed columns "
+                  f"{changed_columns}, {notes_written} notes and {logs_written} logs written.")
         return True
 
     except Exception as e:
         conn.rollback()
+        if isinstance(e, sqlite3.Error):
+            metrics.record_db_error(e)
         print(f"Error importing case {case.get('dnr', 'unknown')}: {str(e)}")
         return False
 
 
+def validate_xml_file(file_path: str) -> Dict[str, Any]:
+    """
+    Check a single XML file without touching the database.
+
+    Runs in a worker process during --dry-run. Returns a report entry with
+    the DNR, the problems found in the file itself and the entity references
+    that have to be checked against the database by the caller.
+    """
+    entry = {'file': file_path, 'dnr': None, 'errors': [], 'refs': {}}
+    errors = entry['errors']
+
+    def error(code, message):
+        errors.append({'code': code, 'message': message})
+
+    try:
+        case_element = ET.parse(file_path).getroot().find('.//AErende')
+    except (ET.ParseError, OSError) as e:
+        error('parse_error', str(e))
+        return entry
+
+    if case_element is None:
+        error('no_case', 'No AErende element found')
+        return entry
+
+    try:
+        case_data = extract_case(case_element)
+    except ValueError as e:
+        error('invalid_number', str(e))
+        return entry
+
+    case = case_data['case']
+    entry['dnr'] = case['dnr']
+    if case['dnr'] <= 0:
+        error('missing_dnr', 'Diarienummer is missing or not positive')
+
+    status = case_element.findtext('Status', '')
+    if status not in STATUS_MAP:
+        error('unknown_status', f"Unknown status code {status!r}")
+
+    direction = case_element.findtext('Riktning', '')
+    if direction not in DIRECTION_MAP:
+        error('unknown_direction', f"Unknown direction code {direction!r}")
+
+    for haendelse in case_element.findall('.//Haendelse'):
+        direction = haendelse.findtext('Riktning', '')
+        if direction not in DIRECTION_MAP:
+            error('unknown_direction',
+                  f"Unknown direction code {direction!r} in Haendelse {haendelse.findtext('Loepnummer', '?')}")
+
+    if not case['registrator']:
+        error('missing_registrator', 'Registrator is missing; the case cannot be linked to a registry')
+
+    lnrs = Counter(note['lnr'] for note in case_data['notes'])
+    for lnr, count in sorted(lnrs.items()):
+        if count > 1:
+            error('duplicate_note', f"Loepnummer {lnr} occurs {count} times")
+
+    # LOG is keyed on (DNR, REG_ID, LOGDAT); import_case rejects logs sharing a key
+    log_keys = [(log['registrator'] or case['registrator'], log['logdat']) for log in case_data['logs']]
+    for registrator, logdat, count in sorted(duplicate_log_keys(log_keys), key=str):
+        error('duplicate_log', f"{count} logs by {registrator!r} at {logdat}")
+    undated = sum(1 for log in case_data['logs'] if not log['logdat'])
+    if undated:
+        error('missing_log_date', f"{undated} Logg elements have no AEndringsdatum")
+
+    # Dossiers and units are only created by the import when the file names them
+    if case['doss_nr']:
+        entry['refs']['doss_nr'] = (case['doss_nr'], bool(case['dossier_name']))
+    if case['enht_kod']:
+        entry['refs']['enht_kod'] = (case['enht_kod'], bool(case['enhet_name']))
+
+    return entry
+
+
+def find_xml_files(paths: List[str]) -> List[str]:
+    """Expand directories to the XML files they contain."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                files.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                             if name.lower().endswith('.xml'))
+        else:
+            files.append(path)
+    return files
+
+
+def validate_files(files: List[str], report_path: Optional[str], jobs: Optional[int],
+                   db_path: str = 'case_management.db', merge: bool = False,
+                   archive_path: str = ARCHIVE_PATH) -> int:
+    """
+    Validate files in parallel and write one JSONL report line per file.
+
+    Lines are written as the workers finish, so they are not in file order
+    and only the DNRs seen so far are kept. Checks that need the batch or
+    the database (duplicate DNRs, references to dossiers and units that
+    would not be created) are done here; a reference that neither the
+    database nor the files seen so far can resolve holds its line back
+    until the end. With merge=True, cases already in the database are
+    expected and not reported; cases in the archive database are reported
+    either way. Returns the number of files with problems.
+    """
+    existing_dnrs, archived_dnrs, existing_dossiers, existing_units = set(), set(), set(), set()
+    if os.path.isfile(archive_path):
+        conn = sqlite3.connect(f'file:{archive_path}?mode=ro', uri=True)
+        try:
+            archived_dnrs = {row[0] for row in conn.execute('SELECT DNR FROM AERENDE')}
+        finally:
+            conn.close()
+    if os.path.isfile(db_path):
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            existing_dnrs = {row[0] for row in conn.execute('SELECT DNR FROM AERENDE')}
+            existing_dossiers = {row[0] for row in conn.execute('SELECT DOSS_NR FROM DOSSIEPLAN')}
+            existing_units = {row[0] for row in conn.execute('SELECT ENHT_KOD FROM ENHET')}
+        finally:
+            conn.close()
+
+    # Dossiers and units named by a file will be created by the import
+    known_dossiers, known_units = set(existing_dossiers), set(existing_units)
+    seen_dnrs = {}
+    pending = []
+    problems = Counter()
+    failed = 0
+
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, min(256, len(files) // (jobs * 4)))
+    report = open(report_path, 'w', encoding='utf-8') if report_path else sys.stdout
+
+    def write(entry, refs):
+        nonlocal failed
+        doss_nr = refs.get('doss_nr', (None, False))[0]
+        if doss_nr and doss_nr not in known_dossiers:
+            entry['errors'].append({'code': 'missing_dossier',
+                                    'message': f"Dossier {doss_nr} does not exist and has no Rubrik"})
+        enht_kod = refs.get('enht_kod', (None, False))[0]
+        if enht_kod and enht_kod not in known_units:
+            entry['errors'].append({'code': 'missing_unit',
+                                    'message': f"Unit {enht_kod} does not exist and has no name"})
+
+        entry['status'] = 'error' if entry['errors'] else 'ok'
+        if entry['errors']:
+            failed += 1
+            problems.update(error['code'] for error in entry['errors'])
+        report.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    try:
+        with Pool(jobs) as pool:
+            for entry in pool.imap_unordered(validate_xml_file, files, chunksize=chunksize):
+                refs = entry.pop('refs')
+                doss_nr, named = refs.get('doss_nr', (None, False))
+                if named:
+                    known_dossiers.add(doss_nr)
+                enht_kod, named = refs.get('enht_kod', (None, False))
+                if named:
+                    known_units.add(enht_kod)
+
+                dnr = entry['dnr']
+                if dnr:
+                    if dnr in archived_dnrs:
+                        entry['errors'].append({'code': 'archived_dnr',
+                                                'message': f"Case {dnr} is in the archive database"})
+                    elif dnr in existing_dnrs and not merge:
+                        entry['errors'].append({'code': 'duplicate_dnr_db',
+                                                'message': f"Case {dnr} already exists in the database"})
+                    if dnr in seen_dnrs:
+                        entry['errors'].append({'code': 'duplicate_dnr_batch',
+                                                'message': f"Case {dnr} also in {seen_dnrs[dnr]}"})
+                    else:
+                        seen_dnrs[dnr] = entry['file']
+
+                # A later file may still name the dossier or unit
+                if (doss_nr and doss_nr not in known_dossiers) or (enht_kod and enht_kod not in known_units):
+                    pending.append((entry, refs))
+                else:
+                    write(entry, refs)
+
+        for entry, refs in pending:
+            write(entry, refs)
+    finally:
+        if report is not sys.stdout:
+            report.close()
+
+    # Keep the summary out of the report when the report goes to stdout
+    out = sys.stdout if report_path else sys.stderr
+    print(f"Validated {len(files)} files with {jobs} workers: {len(files) - failed} ok, {failed} with problems.",
+          file=out)
+    for code, count in problems.most_common():
+        print(f"  {code}: {count}", file=out)
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Import case data from XML files into the database.')
     parser.add_argument('files', metavar='file', type=str, nargs='+',
-                        help='XML files to import')
+                        help='XML files to import, or directories containing them')
     parser.add_argument('--dry-run', action='store_true',
-                        help='Parse XML but do not insert into database')
+                        help='Validate the XML in parallel but do not insert into database')
+    parser.add_argument('--merge', action='store_true',
+                        help='Update cases that already exist instead of skipping them')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Worker processes for --dry-run (default: number of CPUs)')
+    parser.add_argument('--report', metavar='PATH', default=None,
+                        help='Write the --dry-run report as JSONL to PATH (default: stdout)')
+    parser.add_argument('--metrics-file', metavar='PATH', default=None,
+                        help='Write import metrics in Prometheus text format to PATH when done')
 
     args = parser.parse_args()
 
-    if not args.files:
+    files = find_xml_files(args.files)
+    if not files:
         print("No files specified. Use python import_xml.py <file1.xml> [file2.xml] ...")
         return
 
+    if args.dry_run:
+        failed = validate_files(files, args.report, args.jobs, merge=args.merge)
+        sys.exit(1 if failed else 0)
+
     # Connect to database
-    conn = get_db_connection() if not args.dry_run else None
+    conn = get_db_connection()
 
     # Process each file
     successful_imports = 0
-    for file_path in args.files:
+    run_started = time.perf_counter()
+    for file_path in files:
         print(f"Processing {file_path}...")
+        started = time.perf_counter()
 
         if not os.path.isfile(file_path):
             print(f"File not found: {file_path}")
+            metrics.IMPORT_CASES.inc(labels=('missing',))
             continue
 
         case_data = parse_xml_file(file_path)
 
         if not case_data:
             print(f"No valid case data found in {file_path}")
+            metrics.IMPORT_CASES.inc(labels=('invalid',))
             continue
 
-        if args.dry_run:
-            print(f"Dry run - would import case {case_data.get('case', {}).get('dnr', 'unknown')}")
+        if import_case(conn, case_data, merge=args.merge):
+            print(f"Successfully imported case {case_data.get('case', {}).get('dnr', 'unknown')}")
             successful_imports += 1
+            metrics.IMPORT_CASES.inc(labels=('imported',))
         else:
-            if import_case(conn, case_data):
-                print(f"Successfully imported case {case_data.get('case', {}).get('dnr', 'unknown')}")
-                successful_imports += 1
-            else:
-                print(f"Failed to import {file_path}")
+            print(f"Failed to import {file_path}")
+            metrics.IMPORT_CASES.inc(labels=('failed',))
+        metrics.IMPORT_CASE_DURATION.observe(time.perf_counter() - started)
+
+    conn.close()
+
+    elapsed = time.perf_counter() - run_started
+    throughput = successful_imports / elapsed if elapsed > 0 else 0.0
+    metrics.IMPORT_THROUGHPUT.set(throughput)
 
-    if conn:
-        conn.close()
+    print(f"Import completed. Successfully imported {successful_imports} of {len(files)} files "
+          f"({throughput:.1f} cases/s).")
 
-    print(f"Import completed. Successfully imported {successful_imports} of {len(args.files)} files.")
+    if args.metrics_file:
+        with open(args.metrics_file, 'w', encoding='utf-8') as f:
+            f.write(metrics.render_metrics([
+                metrics.IMPORT_CASES, metrics.IMPORT_CASE_DURATION, metrics.IMPORT_THROUGHPUT
+            ]))
 
 
 if __name__ == "__main__":
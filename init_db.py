@@ -1,6 +1,8 @@
 import os
 import sqlite3
 from config import Config
+from app.utils.schema import execute_sql_file
+from app.utils.case_summary import ensure_case_summary
 
 
 def init_db():
@@ -14,10 +16,11 @@ def init_db():
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
     # Connect to database and execute schema
-    with sqlite3.connect(db_path) as conn:
-        with open(schema_path, 'r') as f:
-            script = f.read()
-            conn.executescript(script)
+    # The schema version is left untouched, so the application still runs
+    # its own bootstrap (including the users table) on first start
+    with sqlite3.connect(db_path, timeout=Config.SQLITE_BUSY_TIMEOUT) as conn:
+        execute_sql_file(conn, schema_path)
+        ensure_case_summary(conn)
 
     print("Database initialized successfully!")
 
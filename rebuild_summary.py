@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Rebuild the denormalized case summary table (AERENDE_LISTA).
+
+The table is normally kept current by triggers; run this after bulk changes
+made with triggers disabled, or if the summary is suspected to be out of sync.
+Usage: python rebuild_summary.py [--db case_management.db]
+"""
+
+import argparse
+import sqlite3
+
+from config import Config
+from app.utils.case_summary import ensure_case_summary, rebuild_case_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the case summary table used by the list views.')
+    parser.add_argument('--db', default=Config.DATABASE_PATH,
+                        help='Path to the SQLite database')
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.db, timeout=Config.SQLITE_BUSY_TIMEOUT) as conn:
+        ensure_case_summary(conn)
+        count = rebuild_case_summary(conn)
+
+    print(f"Case summary rebuilt with {count} cases.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,32 @@
--- Drop tables if they exist
-DROP TABLE IF EXISTS AERENDE_ANT;
-DROP TABLE IF EXISTS LOG;
-DROP TABLE IF EXISTS AERENDE;
-DROP TABLE IF EXISTS DOSSIEPLAN;
-DROP TABLE IF EXISTS HANDLAEGGARE;
-DROP TABLE IF EXISTS ENHET;
-DROP TABLE IF EXISTS REG;
+-- Base schema. Statements are idempotent and never drop data; the file is
+-- applied by the schema bootstrap (app/utils/schema.py) and by init_db.py.
 
 
-CREATE TABLE REG (
+CREATE TABLE IF NOT EXISTS REG (
     REG_ID TEXT PRIMARY KEY,
     REG_NAMN TEXT NOT NULL
 );
 
 
-CREATE TABLE DOSSIEPLAN (
+CREATE TABLE IF NOT EXISTS DOSSIEPLAN (
     DOSS_NR INTEGER PRIMARY KEY,
     NAMN TEXT NOT NULL
 );
 
 
-CREATE TABLE HANDLAEGGARE (
+CREATE TABLE IF NOT EXISTS HANDLAEGGARE (
     HAND_ID TEXT PRIMARY KEY,
     HAND_NAMN TEXT NOT NULL
 );
 
 
-CREATE TABLE ENHET (
+CREATE TABLE IF NOT EXISTS ENHET (
     ENHT_KOD TEXT PRIMARY KEY,
     ENHT_NAMN TEXT NOT NULL
 );
 
 
-CREATE TABLE AERENDE (
+CREATE TABLE IF NOT EXISTS AERENDE (
     DNR INTEGER PRIMARY KEY,
     REG_ID TEXT NOT NULL,
     IN_UT TEXT,
@@ -53,7 +47,7 @@ CREATE TABLE AERENDE (
 );
 
 
-CREATE TABLE AERENDE_ANT (
+CREATE TABLE IF NOT EXISTS AERENDE_ANT (
     DNR INTEGER,
     LNR INTEGER,
     IN_UT TEXT,
@@ -71,7 +65,7 @@ CREATE TABLE AERENDE_ANT (
 );
 
 
-CREATE TABLE LOG (
+CREATE TABLE IF NOT EXISTS LOG (
     DNR INTEGER,
     REG_ID TEXT,
     LOGDAT DATE,